@@ -7,22 +7,62 @@ st.set_page_config(
     layout="wide"
 )
 
+# Pre-import heavy modules and open the API connection in the background (once per process)
+from modules.warmup import start_warmup, warmup_report
+start_warmup()
+
 # Get API key from Streamlit secrets
 api_key = st.secrets["STABILITY_API_KEY"]
 
-# Sidebar navigation (removed Upscale)
+# Sidebar navigation
 st.sidebar.title("🎨 AI Image Studio")
 page = st.sidebar.selectbox(
     "Choose a feature:",
-    ["🏠 Home", "✨ Generate", "✏️ Edit", "🎛️ Control"]
+    ["🏠 Home", "✨ Generate", "✏️ Edit", "📈 Upscale", "🔗 Pipeline", "🕘 History", "🎛️ Control"]
+)
+
+# Output format for every API call and download
+from modules.utils import OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT
+format_labels = list(OUTPUT_FORMATS.keys())
+default_label = next(label for label, value in OUTPUT_FORMATS.items() if value == DEFAULT_OUTPUT_FORMAT)
+output_label = st.sidebar.selectbox(
+    "Output format:",
+    format_labels,
+    index=format_labels.index(default_label),
+    help="WebP/JPEG are several times smaller than PNG; background removal always keeps transparency"
 )
+st.session_state.output_format = OUTPUT_FORMATS[output_label]
+
+# Result cache stats
+from modules.cache import get_cache
+cache_stats = get_cache().stats()
+st.sidebar.caption(
+    f"Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses · "
+    f"{cache_stats['bytes'] / 1024 / 1024:.1f} of {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB"
+)
+
+# Result history memory usage
+from modules.history import show_history_usage
+show_history_usage()
+
+# Per-endpoint performance (also exposed as Prometheus text, see modules/metrics.py)
+from modules.metrics import registry, start_metrics_server
+start_metrics_server()
+with st.sidebar.expander("⏱️ Performance"):
+    rows = registry.summary()
+    if rows:
+        st.dataframe(rows, hide_index=True)
+    else:
+        st.caption("No API calls yet")
+    st.caption("Startup warm-up (run `python -m modules.warmup` for an import-time breakdown)")
+    st.dataframe(warmup_report(), hide_index=True)
 
 # Main content based on selected page
 if page == "🏠 Home":
     st.title("🎨 AI Image Studio")
     st.write("Your personal AI-powered image creation and editing suite")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.subheader("✨ Generate")
@@ -33,6 +73,10 @@ if page == "🏠 Home":
         st.write("Professional editing with inpainting, background removal, and object manipulation")
         
     with col3:
+        st.subheader("📈 Upscale")
+        st.write("Enhance resolution of images of any size with tiled upscaling")
+        
+    with col4:
         st.subheader("🎛️ Control")
         st.write("Precise control over image generation")
 
@@ -46,6 +90,21 @@ elif page == "✏️ Edit":
     from modules.edit import show_edit_interface
     show_edit_interface(api_key)
 
+elif page == "📈 Upscale":
+    st.header("📈 Image Upscaling")
+    from modules.upscale import show_upscale_interface
+    show_upscale_interface(api_key)
+
+elif page == "🔗 Pipeline":
+    st.header("🔗 Edit Pipelines")
+    from modules.pipeline import show_pipeline_interface
+    show_pipeline_interface(api_key)
+
+elif page == "🕘 History":
+    st.header("🕘 Result History")
+    from modules.history import show_history_interface
+    show_history_interface()
+
 elif page == "🎛️ Control":
     st.header("🎛️ Advanced Control")
     st.write("Control features coming soon...")
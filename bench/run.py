@@ -0,0 +1,263 @@
+"""Benchmarks against the local stub server; results are written as JSON so runs can be compared across commits.
+
+Usage:
+    python -m bench.run --output results/$(git rev-parse --short HEAD).json
+    python -m bench.run --quick --latency 0.5 --jitter 0.2 --error-rate 0.05
+    python -m bench.run --replay recordings/
+    python -m bench.run --compare results/old.json results/new.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Measure the request path itself: no result cache, no coalescing of identical concurrent calls
+# and no client-side rate limit. These are read at import time, so they must be set before the modules below load.
+os.environ["STABILITY_CACHE_DIR"] = tempfile.mkdtemp(prefix="stability-bench-cache-")
+os.environ["STABILITY_CACHE_MAX_BYTES"] = "0"
+os.environ["STABILITY_SINGLE_FLIGHT"] = "0"
+os.environ.setdefault("STABILITY_RATE_LIMIT", "100000")
+os.environ.setdefault("STABILITY_RATE_BURST", "1000")
+os.environ.setdefault("STABILITY_POOL_SIZE", "64")
+
+from PIL import Image, ImageDraw
+from bench.stub_server import StubConfig, StubServer, synthetic_image, parse_size
+from modules.utils import configure_client, capture_errors
+from modules.payload import ImagePayload, ImageResult
+from modules.metrics import registry
+from modules.edit import (
+    search_and_replace,
+    erase_with_mask,
+    replace_background_and_relight,
+    remove_background,
+    inpaint_with_white_mask_image
+)
+from modules.generate import generate_image
+from modules.upscale import upscale_image
+
+API_KEY = "sk-bench"
+CODEC_SIZES = {"1MP": (1024, 1024), "4MP": (2048, 2048), "9MP": (3072, 3072)}
+CODEC_FORMATS = ("PNG", "JPEG", "WEBP")
+CONCURRENCY_LEVELS = (1, 2, 4, 8, 16)
+SCALING_OPERATION = "remove-background"
+# Metrics compared by --compare: lower is better for *_ms, higher for throughput
+COMPARED_METRICS = ("median_ms", "p95_ms", "throughput")
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "median_ms": round(1000 * ordered[len(ordered) // 2], 3),
+        "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(1000 * ordered[0], 3),
+        "samples": len(ordered)
+    }
+
+def load_test_image(size):
+    image = Image.open(io.BytesIO(synthetic_image(size, "png")))
+    image.load()
+    return image
+
+def bench_codec(sizes, repeats):
+    """Upload encode and response decode cost per format and image size"""
+    rows = {}
+    for label, size in sizes.items():
+        image = load_test_image(size)
+        for fmt in CODEC_FORMATS:
+            encode_times = timed(lambda: ImagePayload.from_image(image).encoded((fmt,)), repeats)
+            data, _ = ImagePayload.from_image(image).encoded((fmt,))
+            decode_times = timed(lambda: ImageResult(data).image, repeats)
+            rows[f"codec/{label}/{fmt}"] = {
+                "size": list(size),
+                "bytes": len(data),
+                "encode": summarize(encode_times),
+                "decode": summarize(decode_times)
+            }
+    return rows
+
+def build_operations(image):
+    """name -> zero-argument call of each API function the app uses"""
+    mask = Image.new("L", image.size, 0)
+    width, height = image.size
+    ImageDraw.Draw(mask).rectangle((width // 4, height // 4, width // 2, height // 2), fill=255)
+    small = image.resize((512, 512))
+
+    return {
+        "generate": lambda: generate_image(API_KEY, "a lighthouse at dusk"),
+        "search-and-replace": lambda: search_and_replace(API_KEY, image, "car", "bicycle"),
+        "erase": lambda: erase_with_mask(API_KEY, image, mask),
+        "inpaint": lambda: inpaint_with_white_mask_image(API_KEY, image, mask, "a vase of flowers"),
+        "remove-background": lambda: remove_background(API_KEY, image),
+        "replace-background": lambda: replace_background_and_relight(API_KEY, image, "a sunny beach"),
+        "upscale": lambda: upscale_image(API_KEY, small)
+    }
+
+def call_operation(fn):
+    """Run one call end to end, including decoding the result"""
+    with capture_errors() as errors:
+        result = fn()
+    if result is None:
+        raise RuntimeError("; ".join(errors) or "No result returned")
+    result.image
+
+def bench_functions(operations, calls):
+    """Sequential latency and throughput of each function through the stub"""
+    rows = {}
+    for name, fn in operations.items():
+        samples, failures = [], 0
+        started = time.perf_counter()
+        for _ in range(calls):
+            call_started = time.perf_counter()
+            try:
+                call_operation(fn)
+            except RuntimeError:
+                failures += 1
+            samples.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        rows[f"call/{name}"] = {
+            "latency": summarize(samples),
+            "throughput": round(calls / elapsed, 3),
+            "failures": failures
+        }
+    return rows
+
+def bench_scaling(fn, levels, calls_per_worker):
+    """Throughput of one function as the number of concurrent callers grows"""
+    rows = {}
+    for workers in levels:
+        total = workers * calls_per_worker
+        failures = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(call_operation, fn) for _ in range(total)]
+            for future in futures:
+                try:
+                    future.result()
+                except RuntimeError:
+                    failures += 1
+        elapsed = time.perf_counter() - started
+        rows[f"scaling/{SCALING_OPERATION}/{workers}"] = {
+            "workers": workers,
+            "calls": total,
+            "throughput": round(total / elapsed, 3),
+            "failures": failures
+        }
+    return rows
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def run(args):
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.size,
+                        replay_dir=args.replay)
+    sizes = {"1MP": CODEC_SIZES["1MP"]} if args.quick else CODEC_SIZES
+    repeats = 3 if args.quick else args.repeats
+    calls = 3 if args.quick else args.calls
+    levels = (1, 4) if args.quick else CONCURRENCY_LEVELS
+
+    results = {}
+    print("Encode/decode...", flush=True)
+    results.update(bench_codec(sizes, repeats))
+
+    with StubServer(config) as server:
+        configure_client(api_host=server.url)
+        operations = build_operations(load_test_image(CODEC_SIZES["1MP"]))
+        print(f"Per-function calls against {server.url}...", flush=True)
+        results.update(bench_functions(operations, calls))
+        print("Concurrency scaling...", flush=True)
+        results.update(bench_scaling(operations[SCALING_OPERATION], levels, calls))
+
+    commit, dirty = git_revision()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "size": list(args.size),
+            "replay": args.replay,
+            "quick": args.quick
+        },
+        "results": results,
+        # Phase breakdown recorded by modules.metrics during the calls above
+        "metrics": registry.summary()
+    }
+
+def _flatten(row, prefix=""):
+    for key, value in row.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+def compare(old_path, new_path):
+    """Print the change in each compared metric between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}")
+    for name in sorted(set(old["results"]) & set(new["results"])):
+        old_values = dict(_flatten(old["results"][name]))
+        for key, new_value in _flatten(new["results"][name]):
+            if not key.endswith(COMPARED_METRICS) or key not in old_values:
+                continue
+            old_value = old_values[key]
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"{name:40} {key:18} {old_value:12.3f} {new_value:12.3f} {change:+8.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Stability client against a local stub server")
+    parser.add_argument("--output", help="Write results JSON here (default: print to stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    parser.add_argument("--quick", action="store_true", help="Small sizes and few repeats")
+    parser.add_argument("--repeats", type=int, default=10, help="Repeats per encode/decode measurement")
+    parser.add_argument("--calls", type=int, default=10, help="Calls per function (and per worker when scaling)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub server response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--size", type=parse_size, default=(1024, 1024), help="Stub result size, e.g. 1024x1024")
+    parser.add_argument("--replay", help="Serve responses recorded with bench.stub_server --record")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""Local stand-in for the Stability v2beta stable-image endpoints, so nothing here spends credits.
+
+Usage:
+    python -m bench.stub_server --port 8765 --latency 0.5 --jitter 0.2 --error-rate 0.05
+    python -m bench.stub_server --port 8765 --record recordings/ --upstream https://api.stability.ai
+    python -m bench.stub_server --port 8765 --replay recordings/
+
+Then run the app or batch runner with STABILITY_API_HOST=http://127.0.0.1:8765.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import itertools
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+from PIL import Image
+
+ENDPOINT_PREFIX = "/v2beta/stable-image/"
+# Endpoints the app calls; anything else under the prefix gets a 404 like the real API
+ENDPOINTS = (
+    "generate/ultra",
+    "edit/search-and-replace",
+    "edit/erase",
+    "edit/inpaint",
+    "edit/remove-background",
+    "edit/replace-background-and-relight",
+    "upscale/conservative"
+)
+DEFAULT_SIZE = (1024, 1024)
+RESPONSE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+_OUTPUT_FORMAT_FIELD = re.compile(rb'name="output_format"\r\n\r\n(\w+)\r\n')
+
+class StubConfig:
+    """Behaviour of the stand-in server"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, size=DEFAULT_SIZE,
+                 replay_dir=None, record_dir=None, upstream=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.size = size
+        self.replay_dir = replay_dir
+        self.record_dir = record_dir
+        self.upstream = upstream.rstrip("/") if upstream else None
+
+@lru_cache(maxsize=32)
+def synthetic_image(size, output_format):
+    """Encoded stand-in result: a gradient with noise, so codecs do realistic amounts of work"""
+    width, height = size
+    rng = np.random.default_rng(width * 31 + height)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                     np.full((height, width), 128, np.float32)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 24, base.shape), 0, 255).astype(np.uint8)
+
+    buf = io.BytesIO()
+    image = Image.fromarray(pixels)
+    if output_format == "jpeg":
+        image.save(buf, format="JPEG", quality=90)
+    elif output_format == "webp":
+        image.save(buf, format="WEBP", quality=90)
+    else:
+        image.save(buf, format="PNG")
+    return buf.getvalue()
+
+class Recordings:
+    """Recorded upstream responses on disk: <dir>/<endpoint>/<n>.bin plus <n>.json metadata"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _endpoint_dir(self, endpoint):
+        return os.path.join(self.directory, endpoint.replace("/", "__"))
+
+    def save(self, endpoint, status, content_type, body, seconds):
+        directory = self._endpoint_dir(endpoint)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            existing = [name for name in os.listdir(directory) if name.endswith(".bin")]
+            index = len(existing)
+            with open(os.path.join(directory, f"{index}.bin"), "wb") as f:
+                f.write(body)
+            with open(os.path.join(directory, f"{index}.json"), "w") as f:
+                json.dump({"status": status, "content_type": content_type, "seconds": seconds}, f)
+
+    def load(self):
+        """endpoint -> list of (status, content_type, body, seconds)"""
+        found = {}
+        for endpoint in ENDPOINTS:
+            directory = self._endpoint_dir(endpoint)
+            if not os.path.isdir(directory):
+                continue
+            responses = []
+            names = sorted((name for name in os.listdir(directory) if name.endswith(".json")),
+                           key=lambda name: int(name.split(".")[0]))
+            for name in names:
+                with open(os.path.join(directory, name)) as f:
+                    meta = json.load(f)
+                with open(os.path.join(directory, name[:-5] + ".bin"), "rb") as f:
+                    responses.append((meta["status"], meta["content_type"], f.read(), meta.get("seconds", 0.0)))
+            if responses:
+                found[endpoint] = responses
+        return found
+
+class StubServer:
+    """Threaded HTTP server answering like the Stability API"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self.requests = 0
+        self._counter_lock = threading.Lock()
+        self._recordings = Recordings(self.config.record_dir) if self.config.record_dir else None
+        self._replay = {}
+        if self.config.replay_dir:
+            self._replay = {endpoint: itertools.cycle(responses)
+                            for endpoint, responses in Recordings(self.config.replay_dir).load().items()}
+        self._replay_lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, request):
+        body = request.rfile.read(int(request.headers.get("Content-Length", 0)))
+        with self._counter_lock:
+            self.requests += 1
+
+        if not request.path.startswith(ENDPOINT_PREFIX) or request.path[len(ENDPOINT_PREFIX):] not in ENDPOINTS:
+            self._send_json(request, 404, {"errors": [f"Unknown endpoint {request.path}"]})
+            return
+        endpoint = request.path[len(ENDPOINT_PREFIX):]
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            self._send_json(request, 401, {"errors": ["Missing API key"]})
+            return
+
+        if self.config.upstream:
+            self._proxy(request, endpoint, body)
+            return
+
+        config = self.config
+        replayed = None
+        if endpoint in self._replay:
+            with self._replay_lock:
+                replayed = next(self._replay[endpoint])
+
+        if config.latency or config.jitter or replayed is None:
+            delay = max(0.0, config.latency + random.uniform(-config.jitter, config.jitter))
+        else:
+            # Replays keep the timing they were recorded with unless latency is overridden
+            delay = replayed[3]
+        time.sleep(delay)
+
+        if random.random() < config.error_rate:
+            headers = {"Retry-After": "1"} if config.error_status == 429 else {}
+            self._send_json(request, config.error_status, {"errors": ["Injected stub failure"]}, headers)
+            return
+
+        if replayed is not None:
+            status, content_type, data, _ = replayed
+        else:
+            match = _OUTPUT_FORMAT_FIELD.search(body)
+            output_format = match.group(1).decode() if match else "png"
+            if endpoint == "edit/remove-background" and output_format == "jpeg":
+                output_format = "png"
+            status, content_type = 200, RESPONSE_MIME_TYPES.get(output_format, "image/png")
+            data = synthetic_image(config.size, output_format if output_format in RESPONSE_MIME_TYPES else "png")
+        self._send(request, status, content_type, data)
+
+    def _proxy(self, request, endpoint, body):
+        """Forward to the real API and record what came back"""
+        headers = {name: request.headers[name] for name in ("Authorization", "Accept", "Content-Type")
+                   if name in request.headers}
+        started = time.perf_counter()
+        try:
+            response = requests.post(f"{self.config.upstream}{ENDPOINT_PREFIX}{endpoint}", data=body,
+                                     headers=headers, timeout=(10, 300))
+        except requests.RequestException as e:
+            self._send_json(request, 502, {"errors": [f"Upstream failed: {e}"]})
+            return
+        seconds = time.perf_counter() - started
+
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        if self._recordings is not None:
+            self._recordings.save(endpoint, response.status_code, content_type, response.content, seconds)
+        self._send(request, response.status_code, content_type, response.content)
+
+    def _send_json(self, request, status, payload, headers=None):
+        self._send(request, status, "application/json", json.dumps(payload).encode(), headers)
+
+    def _send(self, request, status, content_type, data, headers=None):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+def parse_size(text):
+    width, sep, height = text.lower().partition("x")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got '{text}'")
+    return int(width), int(height)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in Stability API server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--size", type=parse_size, default=DEFAULT_SIZE, help="Synthetic result size, e.g. 1024x1024")
+    parser.add_argument("--replay", help="Serve responses recorded with --record")
+    parser.add_argument("--record", help="Directory to record upstream responses into (needs --upstream)")
+    parser.add_argument("--upstream", help="Forward requests to this API host")
+    args = parser.parse_args(argv)
+
+    if args.record and not args.upstream:
+        parser.error("--record needs --upstream")
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.size,
+                        args.replay, args.record, args.upstream)
+    server = StubServer(config, args.host, args.port)
+    print(f"Stub Stability API on {server.url} (set STABILITY_API_HOST={server.url})", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
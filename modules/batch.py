@@ -0,0 +1,272 @@
+"""Headless batch runner: stream a directory or manifest of images through an edit/generate function.
+
+Usage:
+    python -m modules.batch remove-background --input photos/ --output out/
+    python -m modules.batch search-and-replace --input photos/ --output out/ \\
+        --param search_prompt="red car" --param replace_prompt="blue car"
+    python -m modules.batch erase --input photos/ --mask mask.png --output out/
+    python -m modules.batch generate --manifest prompts.jsonl --output out/
+    python -m modules.batch pipeline --pipeline steps.json --input photos/ --output out/
+
+Progress is appended to <output>/progress.jsonl; rerunning the same command skips finished items.
+With --dedup, inputs that are near-duplicates of ones processed before (in this or any earlier run)
+are served from the earlier result instead of calling the API again.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image
+from modules.utils import capture_errors
+from modules.cache import read_jsonl
+from modules.ingest import ENDPOINT_MAX_PIXELS, EDIT_MAX_PIXELS, normalize_upload
+from modules.edit import (
+    search_and_replace,
+    erase_with_mask,
+    replace_background_and_relight,
+    remove_background,
+    inpaint_with_white_mask_image
+)
+from modules.generate import generate_image
+from modules.pipeline import Pipeline, PipelineRun
+from modules.dedup import PerceptualIndex, DEDUP_INDEX_PATH, DEDUP_DISTANCE, dedup_context, image_hashes
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+DEFAULT_CONCURRENCY = 4
+PROGRESS_FILENAME = "progress.jsonl"
+
+# name -> (function, endpoint used for input limits, needs input image, needs mask)
+OPERATIONS = {
+    "remove-background": (remove_background, "remove-background", True, False),
+    "search-and-replace": (search_and_replace, "search-and-replace", True, False),
+    "replace-background": (replace_background_and_relight, "replace-background-and-relight", True, False),
+    "erase": (erase_with_mask, "erase", True, True),
+    "inpaint": (inpaint_with_white_mask_image, "inpaint", True, True),
+    "generate": (generate_image, None, False, False)
+}
+
+def iter_directory_items(directory):
+    """Yield one item per image under directory, with ids taken from the relative path"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                item_id = os.path.splitext(os.path.relpath(path, directory))[0]
+                yield {"id": item_id.replace(os.sep, "/"), "input": path}
+
+def iter_manifest_items(manifest_path):
+    """Yield items from a JSONL manifest: {"id", "input", "mask", "params"} (only id is required)"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(line_number))
+            for key in ("input", "mask"):
+                if item.get(key) and not os.path.isabs(item[key]):
+                    item[key] = os.path.join(base, item[key])
+            yield item
+
+class ProgressLog:
+    """Append-only JSONL record of finished items, so interrupted runs resume"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+
+        for entry in read_jsonl(path):
+            if entry.get("status") == "done":
+                self.done.add(entry["id"])
+
+    def record(self, item_id, status, **fields):
+        entry = {"id": item_id, "status": status, "time": time.time(), **fields}
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if status == "done":
+                self.done.add(item_id)
+
+def _load_input(path, max_pixels):
+    with open(path, "rb") as f:
+        return normalize_upload(f.read(), max_pixels)
+
+def _write_result(result, output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    result.save(tmp_path)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def process_pipeline_item(api_key, pipeline, item, output_dir, params):
+    """Run a pipeline on one item, writing <id>/<step>.<ext> for each output; returns the item's directory"""
+    mask = Image.open(item["mask"]) if item.get("mask") else None
+    run = PipelineRun(pipeline, api_key, _load_input(item["input"], EDIT_MAX_PIXELS), mask,
+                      {**params, **item.get("params", {})})
+    results = run.run_all()
+
+    failed = [step_id for step_id, result in results.items() if result is None]
+    if failed:
+        raise RuntimeError("; ".join(run.failure(step_id) for step_id in failed))
+
+    item_dir = os.path.join(output_dir, item["id"])
+    for step_id, result in results.items():
+        _write_result(result, os.path.join(item_dir, f"{step_id}.{result.extension}"))
+    return item_dir
+
+def process_item(api_key, operation, item, output_dir, params, dedup=None):
+    """Run one item and write its result; returns the output path"""
+    if isinstance(operation, Pipeline):
+        return process_pipeline_item(api_key, operation, item, output_dir, params)
+
+    fn, endpoint, needs_image, needs_mask = OPERATIONS[operation]
+    kwargs = {**params, **item.get("params", {})}
+
+    args = [api_key]
+    if needs_image:
+        payload = _load_input(item["input"], ENDPOINT_MAX_PIXELS[endpoint])
+        args.append(payload)
+    if needs_mask:
+        if not item.get("mask"):
+            raise ValueError(f"'{operation}' needs a mask: pass --mask or set \"mask\" on the manifest item")
+        args.append(Image.open(item["mask"]))
+
+    if dedup is not None and needs_image:
+        context = dedup_context(operation, kwargs, item.get("mask"))
+        hashes = image_hashes(payload.image)
+        earlier = dedup.find(context, hashes, payload.size)
+        if earlier is not None:
+            result = dedup.reuse(earlier, payload.size)
+            return _write_result(result, os.path.join(output_dir, f"{item['id']}.{result.extension}"))
+
+    with capture_errors() as errors:
+        result = fn(*args, **kwargs)
+    if result is None:
+        raise RuntimeError("; ".join(errors) or "No result returned")
+
+    output_path = _write_result(result, os.path.join(output_dir, f"{item['id']}.{result.extension}"))
+    if dedup is not None and needs_image:
+        dedup.add(context, hashes, payload.size, result.size, output_path)
+    return output_path
+
+def run_batch(api_key, operation, items, output_dir, params=None, concurrency=DEFAULT_CONCURRENCY,
+              progress_path=None, on_result=None, dedup=None):
+    """Stream items through an operation (name or Pipeline) with bounded concurrency, resuming from the progress log"""
+    if not isinstance(operation, Pipeline) and operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation}'")
+
+    params = params or {}
+    os.makedirs(output_dir, exist_ok=True)
+    progress = ProgressLog(progress_path or os.path.join(output_dir, PROGRESS_FILENAME))
+    summary = {"done": 0, "failed": 0, "skipped": 0}
+
+    def finish(future):
+        item = in_flight.pop(future)
+        try:
+            output_path = future.result()
+        except Exception as e:
+            progress.record(item["id"], "failed", error=str(e))
+            summary["failed"] += 1
+            output_path = None
+        else:
+            progress.record(item["id"], "done", output=output_path)
+            summary["done"] += 1
+        if on_result is not None:
+            on_result(item, output_path, summary)
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for item in items:
+            if item["id"] in progress.done:
+                summary["skipped"] += 1
+                continue
+
+            # Only keep a small window of items in memory, however long the input is
+            while len(in_flight) >= concurrency * 2:
+                completed, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finish(future)
+
+            future = pool.submit(process_item, api_key, operation, item, output_dir, params, dedup)
+            in_flight[future] = item
+
+        while in_flight:
+            completed, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in completed:
+                finish(future)
+
+    return summary
+
+def _parse_param(text):
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected key=value, got '{text}'")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Stability edit/generate operations over many images")
+    parser.add_argument("operation", choices=sorted(OPERATIONS) + ["pipeline"])
+    parser.add_argument("--pipeline", help="JSON file of pipeline steps (for the 'pipeline' operation)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory of input images")
+    source.add_argument("--manifest", help="JSONL manifest of items")
+    parser.add_argument("--mask", help="Mask image used for every item without its own (erase, inpaint)")
+    parser.add_argument("--output", required=True, help="Directory for results and progress log")
+    parser.add_argument("--param", action="append", type=_parse_param, default=[],
+                        help="Function argument as key=value (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--api-key", default=os.environ.get("STABILITY_API_KEY"))
+    parser.add_argument("--dedup", action="store_true", help="Reuse results for near-duplicate inputs")
+    parser.add_argument("--dedup-distance", type=int, default=DEDUP_DISTANCE,
+                        help="Max perceptual-hash bit distance (of 64) to count as a duplicate")
+    parser.add_argument("--dedup-index", default=DEDUP_INDEX_PATH, help="Index file shared across runs")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("Pass --api-key or set STABILITY_API_KEY")
+
+    operation = args.operation
+    if operation == "pipeline":
+        if not args.pipeline:
+            parser.error("The 'pipeline' operation needs --pipeline steps.json")
+        if args.dedup:
+            parser.error("--dedup is not supported for pipelines")
+        try:
+            operation = Pipeline.load(args.pipeline)
+        except ValueError as e:
+            parser.error(f"Invalid pipeline: {e}")
+
+    needs_mask = operation.needs_mask if isinstance(operation, Pipeline) else OPERATIONS[operation][3]
+    if needs_mask and args.input and not args.mask:
+        parser.error(f"'{args.operation}' needs a mask: pass --mask, or use --manifest with a mask per item")
+
+    items = iter_directory_items(args.input) if args.input else iter_manifest_items(args.manifest)
+    if args.mask:
+        items = ({**item, "mask": item.get("mask") or args.mask} for item in items)
+
+    def report(item, output_path, summary):
+        status = "ok" if output_path else "FAILED"
+        print(f"[{summary['done'] + summary['failed']}] {status} {item['id']}", flush=True)
+
+    dedup = PerceptualIndex(args.dedup_index, args.dedup_distance) if args.dedup else None
+    summary = run_batch(args.api_key, operation, items, args.output, dict(args.param),
+                        args.concurrency, on_result=report, dedup=dedup)
+    print(f"Done: {summary['done']}, failed: {summary['failed']}, skipped (already done): {summary['skipped']}")
+    if dedup is not None:
+        print(f"Served from earlier results (near-duplicates): {dedup.hits}")
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# On-disk result cache settings (override with environment variables)
+CACHE_DIR = os.environ.get(
+    "STABILITY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai-image-studio", "results")
+)
+CACHE_MAX_BYTES = int(os.environ.get("STABILITY_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+def read_jsonl(path):
+    """Yield the records of an append-only JSONL file (none if it doesn't exist yet)"""
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A crash mid-write can leave a truncated last line
+                continue
+
+def request_fingerprint(url, files):
+    """Hash endpoint + normalized form fields + input image bytes into a cache key"""
+    digest = hashlib.sha256(url.encode())
+
+    for name in sorted(files):
+        value = files[name][1]
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # Images/masks: only their content matters, not filename or mime type
+            digest.update(f"\0{name}=sha256:".encode())
+            digest.update(hashlib.sha256(value).digest())
+        else:
+            value = str(value).strip()
+            # An empty optional field behaves the same as leaving it out
+            if value:
+                digest.update(f"\0{name}={value}".encode())
+
+    return digest.hexdigest()
+
+class ResultCache:
+    """Content-addressed store of raw response bytes with a byte-budget LRU"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _load_index(self):
+        """Rebuild the LRU order from disk so the cache survives restarts"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".bin"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        with self._lock:
+            self._evict()
+
+    def get(self, key):
+        """Return cached bytes or None, marking the entry as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store response bytes, evicting least recently used entries over budget"""
+        if len(data) > self.max_bytes:
+            return
+
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            return
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Hit/miss counters and current footprint"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+class SingleFlight:
+    """Lets concurrent calls with the same key share one execution and its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (fn's result, shared) where shared is True if another caller's run was joined"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            try:
+                return call.result(), True
+            except Exception:
+                # Only successes are shared: the key leaves out who is calling (e.g. the API key),
+                # so a failed run (a 401 for another account) is retried by each joiner on its own
+                return fn(), False
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide result cache"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+from modules.payload import ImageResult
+from modules.cache import read_jsonl
+
+# Persistent index of inputs already processed (override with environment variables)
+DEDUP_INDEX_PATH = os.environ.get(
+    "STABILITY_DEDUP_INDEX",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai-image-studio", "dedup.jsonl")
+)
+# Max differing bits (of 64) in both pHash and dHash for two inputs to count as the same shot
+DEDUP_DISTANCE = int(os.environ.get("STABILITY_DEDUP_DISTANCE", "6"))
+# Inputs whose aspect ratios differ by more than this are crops, not resizes, and never match
+ASPECT_TOLERANCE = 0.02
+
+PHASH_SIZE = 32
+HASH_SIZE = 8
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+def _gray(image, size):
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        # Hash transparent areas as white, the way product shots are usually shown
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return np.asarray(image.convert("L").resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0), dtype=np.float32)
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+def phash(image):
+    """64-bit DCT perceptual hash: low frequencies compared with their median"""
+    coefficients = _DCT @ _gray(image, (PHASH_SIZE, PHASH_SIZE)) @ _DCT.T
+    low = coefficients[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only tracks overall brightness, so it is left out of the median
+    return _pack(low > np.median(low[1:]))
+
+def dhash(image):
+    """64-bit gradient hash: is each pixel brighter than its left neighbour"""
+    gray = _gray(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(gray[:, 1:] > gray[:, :-1])
+
+def image_hashes(image):
+    return phash(image), dhash(image)
+
+def hamming_distances(hashes, value):
+    """Bit distance from value to every hash in a uint64 array"""
+    differing = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(differing.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+def dedup_context(operation, params, mask_path=None):
+    """Results are only reusable for the same operation, parameters and mask"""
+    digest = hashlib.sha256(f"{operation}\0{json.dumps(params, sort_keys=True, default=str)}".encode())
+    if mask_path:
+        with open(mask_path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+class DedupEntry:
+    def __init__(self, context, phash_value, dhash_value, input_size, result_size, path):
+        self.context = context
+        self.phash = phash_value
+        self.dhash = dhash_value
+        self.input_size = tuple(input_size)
+        self.result_size = tuple(result_size)
+        self.path = path
+
+    def to_json(self):
+        return {
+            "context": self.context,
+            "phash": f"{self.phash:016x}",
+            "dhash": f"{self.dhash:016x}",
+            "input_size": list(self.input_size),
+            "result_size": list(self.result_size),
+            "path": self.path
+        }
+
+class PerceptualIndex:
+    """Append-only JSONL index of processed inputs, searched by Hamming distance per context"""
+
+    def __init__(self, path=DEDUP_INDEX_PATH, max_distance=DEDUP_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self.hits = 0
+        self._entries = {}
+        # context -> (phash array, dhash array), rebuilt after adds
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+        for data in read_jsonl(path):
+            entry = DedupEntry(data["context"], int(data["phash"], 16), int(data["dhash"], 16),
+                               data["input_size"], data["result_size"], data["path"])
+            self._entries.setdefault(entry.context, []).append(entry)
+
+    def _hash_arrays(self, context):
+        if context not in self._arrays:
+            entries = self._entries.get(context, [])
+            self._arrays[context] = (np.array([entry.phash for entry in entries], dtype=np.uint64),
+                                     np.array([entry.dhash for entry in entries], dtype=np.uint64))
+        return self._arrays[context]
+
+    def find(self, context, hashes, input_size):
+        """Closest earlier entry that is a near-duplicate with compatible geometry and a result still on disk"""
+        with self._lock:
+            entries = self._entries.get(context)
+            if not entries:
+                return None
+            phashes, dhashes = self._hash_arrays(context)
+
+        distances = np.maximum(hamming_distances(phashes, hashes[0]), hamming_distances(dhashes, hashes[1]))
+        aspect = input_size[0] / input_size[1]
+        for index in np.argsort(distances, kind="stable"):
+            if distances[index] > self.max_distance:
+                break
+            entry = entries[index]
+            entry_aspect = entry.input_size[0] / entry.input_size[1]
+            if abs(aspect - entry_aspect) > ASPECT_TOLERANCE * entry_aspect:
+                continue
+            if os.path.exists(entry.path):
+                return entry
+        return None
+
+    def add(self, context, hashes, input_size, result_size, path):
+        entry = DedupEntry(context, hashes[0], hashes[1], input_size, result_size, os.path.abspath(path))
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry.to_json()) + "\n")
+            self._entries.setdefault(context, []).append(entry)
+            self._arrays.pop(context, None)
+        return entry
+
+    def reuse(self, entry, input_size):
+        """The entry's result fitted to a new input's geometry; the stored bytes as-is when sizes match"""
+        with open(entry.path, "rb") as f:
+            result = ImageResult(f.read())
+        with self._lock:
+            self.hits += 1
+        if tuple(input_size) == entry.input_size:
+            return result
+
+        # Keep the result's scale relative to its input (e.g. an upscaler's 4x) for the new size
+        scale_x = entry.result_size[0] / entry.input_size[0]
+        scale_y = entry.result_size[1] / entry.input_size[1]
+        target = (max(1, round(input_size[0] * scale_x)), max(1, round(input_size[1] * scale_y)))
+        resized = result.image.resize(target, Image.Resampling.LANCZOS)
+        return ImageResult.from_image(resized, result.source_format or "PNG")
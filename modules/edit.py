@@ -1,462 +1,255 @@
 import streamlit as st
-import requests
+from modules.utils import api_url, request_image_bytes, report_error, StabilityAPIError, DEFAULT_OUTPUT_FORMAT, selected_output_format
+from modules.payload import as_payload, ImageResult
+from modules.ingest import ENDPOINT_MAX_PIXELS, SOURCE_MAX_PIXELS, fit_payload, get_session_payload
+from modules.mask import prepare_mask, rasterize_strokes
+from modules.roi import edit_region, plan_roi, roi_worthwhile
+from modules.jobs import submit_job, show_jobs
+from modules.preview import local_preview, preview_inpaint, preview_remove_background
 import io
+import os
 from PIL import Image
 import base64
-from streamlit.components.v1 import html
+import streamlit.components.v1 as components
 
-def search_and_replace(api_key, image, search_prompt, replace_prompt, negative_prompt="", seed=0):
+# Painting canvas is drawn at most this many pixels on its long side
+CANVAS_MAX_SIZE = 600
+CANVAS_PREVIEW_QUALITY = 85
+DEFAULT_BRUSH_SIZE = 25
+
+# Painting canvas component: sends back stroke lists, the mask is drawn here at full resolution
+_mask_painter = components.declare_component(
+    "mask_painter",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "painter_frontend")
+)
+
+# Text/slider widgets whose values survive switching tools (file uploaders can't be restored)
+TOOL_STATE_KEYS = [
+    "inpaint_prompt", "inpaint_negative", "inpaint_dilate", "inpaint_feather",
+    "search_prompt", "replace_prompt", "search_negative",
+    "bg_prompt", "fg_prompt", "preserve_slider", "bg_negative",
+    "erase_dilate", "erase_feather", "inpaint_roi", "erase_roi"
+]
+
+def search_and_replace(api_key, image, search_prompt, replace_prompt, negative_prompt="", seed=0,
+                       output_format=DEFAULT_OUTPUT_FORMAT):
     """Search and replace using correct Stability AI API format"""
-    url = "https://api.stability.ai/v2beta/stable-image/edit/search-and-replace"
+    url = api_url("edit/search-and-replace")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    image_field = fit_payload(as_payload(image), ENDPOINT_MAX_PIXELS["search-and-replace"]).file_field()
     
     files = {
-        "image": ("image.png", img_byte_arr, "image/png"),
+        "image": image_field,
         "prompt": (None, replace_prompt),
         "search_prompt": (None, search_prompt),
         "negative_prompt": (None, negative_prompt),
         "mode": (None, "search"),
         "seed": (None, str(seed)),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed != 0), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
-def erase_with_mask(api_key, image, mask, seed=0):
+def erase_with_mask(api_key, image, mask, seed=0, output_format=DEFAULT_OUTPUT_FORMAT):
     """Erase using mask (requires actual mask image, not text)"""
-    url = "https://api.stability.ai/v2beta/stable-image/edit/erase"
+    url = api_url("edit/erase")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    payload = fit_payload(as_payload(image), ENDPOINT_MAX_PIXELS["erase"])
+    mask = prepare_mask(payload.image, mask)
     
-    mask_byte_arr = io.BytesIO()
-    mask.save(mask_byte_arr, format='PNG')
-    mask_byte_arr = mask_byte_arr.getvalue()
+    image_field = payload.file_field()
+    mask_field = as_payload(mask).file_field("mask")
     
     files = {
-        "image": ("image.png", img_byte_arr, "image/png"),
-        "mask": ("mask.png", mask_byte_arr, "image/png"),
+        "image": image_field,
+        "mask": mask_field,
         "seed": (None, str(seed)),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed != 0), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
 def replace_background_and_relight(api_key, image, background_prompt, foreground_prompt="", negative_prompt="", 
-                                 preserve_original_subject=0.6, seed=0):
+                                 preserve_original_subject=0.6, seed=0, output_format=DEFAULT_OUTPUT_FORMAT):
     """Replace background using correct API format"""
-    url = "https://api.stability.ai/v2beta/stable-image/edit/replace-background-and-relight"
+    url = api_url("edit/replace-background-and-relight")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    image_field = fit_payload(as_payload(image), ENDPOINT_MAX_PIXELS["replace-background-and-relight"]).file_field()
     
     files = {
-        "subject_image": ("image.png", img_byte_arr, "image/png"),
+        "subject_image": image_field,
         "background_prompt": (None, background_prompt),
         "foreground_prompt": (None, foreground_prompt),
         "negative_prompt": (None, negative_prompt),
         "preserve_original_subject": (None, str(preserve_original_subject)),
         "seed": (None, str(seed)),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed != 0), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
-def remove_background(api_key, image):
-    """Remove background - this one already works"""
-    url = "https://api.stability.ai/v2beta/stable-image/edit/remove-background"
+def remove_background(api_key, image, output_format="png"):
+    """Remove background - PNG (or WebP) keeps the alpha channel"""
+    url = api_url("edit/remove-background")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
+    # JPEG can't carry the cut-out's transparency
+    if output_format == "jpeg":
+        output_format = "png"
     
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    image_field = fit_payload(as_payload(image), ENDPOINT_MAX_PIXELS["remove-background"]).file_field()
     
     files = {
-        "image": ("image.png", img_byte_arr, "image/png"),
-        "output_format": (None, "png")
+        "image": image_field,
+        "output_format": (None, output_format)
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
+        # No seed: background removal is deterministic, so repeats are always served from the cache
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=True), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
-def inpaint_with_white_mask_image(api_key, original_image, mask_image, prompt, negative_prompt="", seed=0):
-    """Inpaint using white painted areas as mask - already working"""
-    url = "https://api.stability.ai/v2beta/stable-image/edit/inpaint"
+def inpaint_with_white_mask_image(api_key, original_image, mask_image, prompt, negative_prompt="", seed=0,
+                                  output_format=DEFAULT_OUTPUT_FORMAT):
+    """Inpaint using white painted areas as mask - painted uploads are reduced to just the strokes"""
+    url = api_url("edit/inpaint")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
-    
-    img_byte_arr = io.BytesIO()
-    original_image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    payload = fit_payload(as_payload(original_image), ENDPOINT_MAX_PIXELS["inpaint"])
+    mask = prepare_mask(payload.image, mask_image)
     
-    mask_gray = mask_image.convert('L')
-    mask_byte_arr = io.BytesIO()
-    mask_gray.save(mask_byte_arr, format='PNG')
-    mask_byte_arr = mask_byte_arr.getvalue()
+    image_field = payload.file_field()
+    mask_field = as_payload(mask).file_field("mask")
     
     files = {
-        "image": ("image.png", img_byte_arr, "image/png"),
-        "mask": ("mask.png", mask_byte_arr, "image/png"),
+        "image": image_field,
+        "mask": mask_field,
         "prompt": (None, prompt),
         "negative_prompt": (None, negative_prompt),
         "mode": (None, "mask"),
         "seed": (None, str(seed)),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed != 0), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
-def image_to_base64(image):
-    """Convert PIL image to base64 string"""
+@st.cache_data(max_entries=16, show_spinner=False)
+def canvas_preview(digest, _payload, max_size=CANVAS_MAX_SIZE):
+    """Display-sized JPEG data URI for the painting canvas, memoized by image hash"""
+    preview = _payload.image.copy()
+    preview.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if preview.mode != "RGB":
+        preview = preview.convert("RGB")
+    
     buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
+    preview.save(buffered, format="JPEG", quality=CANVAS_PREVIEW_QUALITY)
     img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
+    return f"data:image/jpeg;base64,{img_str}", preview.size
+
+def paint_mask(payload, key_prefix):
+    """Show the painting canvas and return the painted mask at full resolution (None until painted)"""
+    image_uri, canvas_size = canvas_preview(payload.digest, payload)
+    # Strokes are kept per image so they survive switching tools and come back on remount
+    state_key = f"{key_prefix}_strokes_{payload.digest[:16]}"
+    saved = st.session_state.get(state_key)
+
+    value = _mask_painter(
+        image=image_uri,
+        width=canvas_size[0],
+        height=canvas_size[1],
+        brush_size=DEFAULT_BRUSH_SIZE,
+        strokes=saved["strokes"] if saved else [],
+        key=f"{key_prefix}_painter_{payload.digest[:16]}",
+        default=None
+    )
+    if value is not None:
+        st.session_state[state_key] = value
+        saved = value
+
+    if not saved or not saved["strokes"]:
+        return None
+    return rasterize_strokes(saved["strokes"], (saved["width"], saved["height"]), payload.size)
+
+def show_mask_preview(payload, mask_source, key_prefix):
+    """Turn a painted mask (or a painted/plain mask upload) into the final mask and show it"""
+    col1, col2 = st.columns(2)
+    with col1:
+        dilate = st.slider("Grow mask (px):", 0, 50, 0, key=f"{key_prefix}_dilate")
+    with col2:
+        feather = st.slider("Feather edges (px):", 0, 30, 0, key=f"{key_prefix}_feather")
+    
+    mask_image = prepare_mask(payload.image, mask_source, dilate=dilate, feather=feather)
+    st.image(mask_image, caption="Mask (white = edit area)", width=300)
+    return mask_image
+
+def show_mask_input(payload, key_prefix, upload_label):
+    """Painting canvas plus an optional mask upload; returns the prepared mask or None"""
+    painted = paint_mask(payload, key_prefix)
+    
+    with st.expander("Or upload a mask instead"):
+        mask_file = st.file_uploader(upload_label, type=['png', 'jpg', 'jpeg'], key=f"{key_prefix}_mask_upload")
+    
+    # An uploaded mask wins over strokes on the canvas
+    mask_source = Image.open(mask_file) if mask_file is not None else painted
+    if mask_source is None:
+        st.caption("Paint over the image to mark the area.")
+        return None
+    return show_mask_preview(payload, mask_source, key_prefix)
 
-def create_white_painting_interface(image):
-    """Create HTML/JS interface for white painting"""
-    img_b64 = image_to_base64(image)
-    
-    max_size = 600
-    if max(image.size) > max_size:
-        ratio = max_size / max(image.size)
-        canvas_width = int(image.size[0] * ratio)
-        canvas_height = int(image.size[1] * ratio)
-    else:
-        canvas_width, canvas_height = image.size
-    
-    html_code = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-            .container {{ max-width: 800px; margin: 0 auto; }}
-            .controls {{ 
-                background: #f0f2f6; 
-                padding: 15px; 
-                border-radius: 8px; 
-                margin-bottom: 15px;
-                display: flex;
-                flex-wrap: wrap;
-                gap: 10px;
-                align-items: center;
-            }}
-            .canvas-container {{ 
-                position: relative; 
-                display: inline-block; 
-                border: 2px solid #ddd; 
-                border-radius: 8px;
-                background: #fff;
-            }}
-            #backgroundCanvas, #drawingCanvas {{ 
-                position: absolute; 
-                top: 0; 
-                left: 0; 
-            }}
-            #backgroundCanvas {{ z-index: 1; }}
-            #drawingCanvas {{ z-index: 2; cursor: crosshair; }}
-            button {{ 
-                padding: 8px 16px; 
-                border: none; 
-                border-radius: 4px; 
-                cursor: pointer; 
-                font-size: 14px;
-                font-weight: 500;
-            }}
-            .btn-primary {{ background: #ff4b4b; color: white; }}
-            .btn-secondary {{ background: #f0f2f6; color: #333; border: 1px solid #ddd; }}
-            .btn-success {{ background: #00d924; color: white; }}
-            input[type="range"] {{ width: 120px; }}
-            .brush-info {{ 
-                background: #e6f3ff; 
-                padding: 8px 12px; 
-                border-radius: 4px; 
-                font-size: 12px;
-            }}
-            .instruction {{ 
-                background: #fff3cd; 
-                border: 1px solid #ffeaa7; 
-                padding: 12px; 
-                border-radius: 6px; 
-                margin-bottom: 15px;
-                color: #856404;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="instruction">
-                <strong>Paint WHITE areas where you want AI to generate new content.</strong>
-            </div>
-            
-            <div class="controls">
-                <label>Brush Size:</label>
-                <input type="range" id="brushSize" min="5" max="80" value="25" oninput="updateBrushSize()">
-                <span id="brushSizeValue" class="brush-info">25px</span>
-                
-                <button class="btn-secondary" onclick="clearCanvas()">Clear All</button>
-                <button class="btn-secondary" onclick="undoLast()">Undo</button>
-                <button class="btn-success" onclick="downloadPaintedImage()">Download Painted Image</button>
-            </div>
-            
-            <div class="canvas-container">
-                <canvas id="backgroundCanvas" width="{canvas_width}" height="{canvas_height}"></canvas>
-                <canvas id="drawingCanvas" width="{canvas_width}" height="{canvas_height}"></canvas>
-            </div>
-        </div>
+def roi_option(payload, mask_image, key_prefix):
+    """Checkbox for sending only the masked region; on by default when that region is a small part of the image"""
+    plan = plan_roi(payload.size, mask_image)
+    if plan is None:
+        return False
+    (left, top, right, bottom), (send_width, send_height) = plan
+    return st.checkbox(
+        "Only send the masked region",
+        value=roi_worthwhile(payload.size, mask_image),
+        key=f"{key_prefix}_roi",
+        help=f"Sends a {send_width}x{send_height} crop of the {right - left}x{bottom - top} area around the mask "
+             f"instead of the whole {payload.size[0]}x{payload.size[1]} image, and blends the result back in "
+             "at full resolution"
+    )
 
-        <script>
-            let isDrawing = false;
-            let brushSize = 25;
-            let strokes = [];
-            let currentStroke = [];
-            
-            const backgroundCanvas = document.getElementById('backgroundCanvas');
-            const drawingCanvas = document.getElementById('drawingCanvas');
-            const backgroundCtx = backgroundCanvas.getContext('2d');
-            const drawingCtx = drawingCanvas.getContext('2d');
-            
-            const img = new Image();
-            img.onload = function() {{
-                backgroundCtx.drawImage(img, 0, 0, {canvas_width}, {canvas_height});
-            }};
-            img.src = '{img_b64}';
-            
-            drawingCtx.fillStyle = 'rgba(255, 255, 255, 0.9)';
-            drawingCtx.strokeStyle = 'rgba(255, 255, 255, 0.9)';
-            drawingCtx.lineWidth = brushSize;
-            drawingCtx.lineCap = 'round';
-            drawingCtx.lineJoin = 'round';
-            
-            drawingCanvas.addEventListener('mousedown', startDrawing);
-            drawingCanvas.addEventListener('mousemove', draw);
-            drawingCanvas.addEventListener('mouseup', stopDrawing);
-            drawingCanvas.addEventListener('mouseout', stopDrawing);
-            
-            drawingCanvas.addEventListener('touchstart', handleTouch);
-            drawingCanvas.addEventListener('touchmove', handleTouch);
-            drawingCanvas.addEventListener('touchend', stopDrawing);
-            
-            function handleTouch(e) {{
-                e.preventDefault();
-                const touch = e.touches[0];
-                const rect = drawingCanvas.getBoundingClientRect();
-                const x = touch.clientX - rect.left;
-                const y = touch.clientY - rect.top;
-                
-                if (e.type === 'touchstart') {{
-                    startDrawing({{offsetX: x, offsetY: y}});
-                }} else if (e.type === 'touchmove') {{
-                    draw({{offsetX: x, offsetY: y}});
-                }}
-            }}
-            
-            function startDrawing(e) {{
-                isDrawing = true;
-                currentStroke = [];
-                currentStroke.push({{x: e.offsetX, y: e.offsetY, size: brushSize}});
-                
-                drawingCtx.beginPath();
-                drawingCtx.arc(e.offsetX, e.offsetY, brushSize/2, 0, 2 * Math.PI);
-                drawingCtx.fill();
-            }}
-            
-            function draw(e) {{
-                if (!isDrawing) return;
-                
-                currentStroke.push({{x: e.offsetX, y: e.offsetY, size: brushSize}});
-                
-                drawingCtx.lineWidth = brushSize;
-                drawingCtx.lineTo(e.offsetX, e.offsetY);
-                drawingCtx.stroke();
-                
-                drawingCtx.beginPath();
-                drawingCtx.arc(e.offsetX, e.offsetY, brushSize/2, 0, 2 * Math.PI);
-                drawingCtx.fill();
-            }}
-            
-            function stopDrawing() {{
-                if (isDrawing) {{
-                    isDrawing = false;
-                    strokes.push([...currentStroke]);
-                }}
-            }}
-            
-            function updateBrushSize() {{
-                brushSize = document.getElementById('brushSize').value;
-                document.getElementById('brushSizeValue').textContent = brushSize + 'px';
-                drawingCtx.lineWidth = brushSize;
-            }}
-            
-            function clearCanvas() {{
-                drawingCtx.clearRect(0, 0, drawingCanvas.width, drawingCanvas.height);
-                strokes = [];
-            }}
-            
-            function undoLast() {{
-                if (strokes.length > 0) {{
-                    strokes.pop();
-                    redrawCanvas();
-                }}
-            }}
-            
-            function redrawCanvas() {{
-                drawingCtx.clearRect(0, 0, drawingCanvas.width, drawingCanvas.height);
-                
-                for (let stroke of strokes) {{
-                    if (stroke.length > 0) {{
-                        drawingCtx.beginPath();
-                        
-                        for (let point of stroke) {{
-                            drawingCtx.arc(point.x, point.y, point.size/2, 0, 2 * Math.PI);
-                            drawingCtx.fill();
-                        }}
-                        
-                        if (stroke.length > 1) {{
-                            drawingCtx.beginPath();
-                            drawingCtx.lineWidth = stroke[0].size;
-                            drawingCtx.moveTo(stroke[0].x, stroke[0].y);
-                            
-                            for (let i = 1; i < stroke.length; i++) {{
-                                drawingCtx.lineTo(stroke[i].x, stroke[i].y);
-                            }}
-                            drawingCtx.stroke();
-                        }}
-                    }}
-                }}
-            }}
-            
-            function downloadPaintedImage() {{
-                const compositeCanvas = document.createElement('canvas');
-                compositeCanvas.width = {image.size[0]};
-                compositeCanvas.height = {image.size[1]};
-                const compositeCtx = compositeCanvas.getContext('2d');
-                
-                const scaleX = {image.size[0]} / {canvas_width};
-                const scaleY = {image.size[1]} / {canvas_height};
-                
-                const originalImg = new Image();
-                originalImg.onload = function() {{
-                    compositeCtx.drawImage(originalImg, 0, 0, {image.size[0]}, {image.size[1]});
-                    
-                    compositeCtx.fillStyle = 'white';
-                    compositeCtx.strokeStyle = 'white';
-                    
-                    for (let stroke of strokes) {{
-                        if (stroke.length > 0) {{
-                            for (let point of stroke) {{
-                                const scaledX = point.x * scaleX;
-                                const scaledY = point.y * scaleY;
-                                const scaledSize = point.size * Math.min(scaleX, scaleY);
-                                
-                                compositeCtx.beginPath();
-                                compositeCtx.arc(scaledX, scaledY, scaledSize/2, 0, 2 * Math.PI);
-                                compositeCtx.fill();
-                            }}
-                            
-                            if (stroke.length > 1) {{
-                                compositeCtx.beginPath();
-                                compositeCtx.lineWidth = stroke[0].size * Math.min(scaleX, scaleY);
-                                compositeCtx.moveTo(stroke[0].x * scaleX, stroke[0].y * scaleY);
-                                
-                                for (let i = 1; i < stroke.length; i++) {{
-                                    compositeCtx.lineTo(stroke[i].x * scaleX, stroke[i].y * scaleY);
-                                }}
-                                compositeCtx.stroke();
-                            }}
-                        }}
-                    }}
-                    
-                    const link = document.createElement('a');
-                    link.download = 'painted_image_white_mask.png';
-                    link.href = compositeCanvas.toDataURL('image/png');
-                    link.click();
-                    
-                    alert('Painted image downloaded! Re-upload it in the upload field below.');
-                }};
-                originalImg.src = '{img_b64}';
-            }}
-        </script>
-    </body>
-    </html>
-    """
-    
-    return html_code
+def keep_tool_state():
+    """Carry widget values of hidden tools across reruns (Streamlit drops state of unrendered widgets)"""
+    for key in TOOL_STATE_KEYS:
+        if key in st.session_state:
+            st.session_state[key] = st.session_state[key]
 
 def show_edit_interface(api_key):
-    """Show tabbed edit interface"""
+    """Show edit interface, rendering only the selected tool"""
     
     st.write("Professional Image Editing Suite")
     st.write("Cost-effective tools (5 credits each)")
@@ -468,80 +261,70 @@ def show_edit_interface(api_key):
     )
     
     if uploaded_file is not None:
-        original_image = Image.open(uploaded_file)
+        # Decoded/encoded once per upload and shared by every tool across reruns
+        try:
+            payload = get_session_payload(uploaded_file, "edit_payload", SOURCE_MAX_PIXELS)
+        except (ValueError, Image.DecompressionBombError) as e:
+            st.error(f"Could not load image: {str(e)}")
+            return
         
         st.write("**Original Image**")
-        st.image(original_image, caption=f"Size: {original_image.size[0]}x{original_image.size[1]}", width=400)
-        
-        # Create tabs for different editing functions
-        tab1, tab2, tab3, tab4, tab5 = st.tabs(["Inpaint", "Remove Background", "Search & Replace", "Replace Background", "Erase Object"])
-        
-        with tab1:
-            show_inpaint_tab(api_key, original_image)
-        
-        with tab2:
-            show_remove_background_tab(api_key, original_image)
+        st.image(payload.display, caption=f"Size: {payload.size[0]}x{payload.size[1]}", width=400)
         
-        with tab3:
-            show_search_replace_tab(api_key, original_image)
+        # Only the selected tool is rendered; the others cost nothing on rerun
+        tools = {
+            "Inpaint": show_inpaint_tab,
+            "Remove Background": show_remove_background_tab,
+            "Search & Replace": show_search_replace_tab,
+            "Replace Background": show_replace_background_tab,
+            "Erase Object": show_erase_object_tab
+        }
         
-        with tab4:
-            show_replace_background_tab(api_key, original_image)
-        
-        with tab5:
-            show_erase_object_tab(api_key, original_image)
+        keep_tool_state()
+        selected_tool = st.radio("Tool:", list(tools.keys()), horizontal=True, key="edit_tool")
+        tools[selected_tool](api_key, payload)
 
-def show_inpaint_tab(api_key, image):
+def show_inpaint_tab(api_key, payload):
     """Inpaint tab - white painting"""
     st.subheader("White Paint Inpainting")
     st.write("Paint white areas where you want AI to generate new content")
     
-    html_interface = create_white_painting_interface(image)
-    html(html_interface, height=700, scrolling=False)
-    
-    painted_file = st.file_uploader(
-        "Upload painted image with white areas:",
-        type=['png', 'jpg', 'jpeg'],
-        key="inpaint_painted"
-    )
+    mask_image = show_mask_input(payload, "inpaint", "Mask or painted image with white areas:")
     
-    if painted_file is not None:
-        painted_image = Image.open(painted_file)
-        st.image(painted_image, caption="Your painted image", width=300)
-        
+    if mask_image is not None:
         col1, col2 = st.columns(2)
         with col1:
             prompt = st.text_area("What should appear in white areas:", key="inpaint_prompt")
         with col2:
             negative_prompt = st.text_area("What to avoid:", key="inpaint_negative")
         
+        roi = roi_option(payload, mask_image, "inpaint")
+        
         if st.button("Apply Inpainting", type="primary", key="inpaint_btn"):
             if prompt.strip():
-                with st.spinner("Inpainting..."):
-                    result = inpaint_with_white_mask_image(api_key, image, painted_image, prompt, negative_prompt)
-                    if result:
-                        st.image(result, caption="Inpainting result")
-                        
-                        buf = io.BytesIO()
-                        result.save(buf, format="PNG")
-                        st.download_button("Download Result", buf.getvalue(), "inpainted.png", "image/png")
+                fn, args = inpaint_with_white_mask_image, (api_key, payload, mask_image, prompt, negative_prompt)
+                if roi:
+                    fn, args = edit_region, (fn,) + args
+                submit_job("inpaint", f"Inpainted: {prompt}", "inpainted", fn, *args,
+                           output_format=selected_output_format(),
+                           preview=local_preview(preview_inpaint, payload.image, mask_image))
+    
+    show_jobs("inpaint")
 
-def show_remove_background_tab(api_key, image):
+def show_remove_background_tab(api_key, payload):
     """Remove background tab"""
     st.subheader("Remove Background")
     st.write("Automatically remove the background while preserving the main subject")
     
     if st.button("Remove Background", type="primary", key="remove_bg_btn"):
-        with st.spinner("Removing background..."):
-            result = remove_background(api_key, image)
-            if result:
-                st.image(result, caption="Background removed")
-                
-                buf = io.BytesIO()
-                result.save(buf, format="PNG")
-                st.download_button("Download Result", buf.getvalue(), "no_background.png", "image/png")
+        submit_job("remove_background", "Background removed", "no_background",
+                   remove_background, api_key, payload,
+                   output_format="webp" if selected_output_format() == "webp" else "png",
+                   preview=local_preview(preview_remove_background, payload.image))
+    
+    show_jobs("remove_background")
 
-def show_search_replace_tab(api_key, image):
+def show_search_replace_tab(api_key, payload):
     """Search and replace tab"""
     st.subheader("Search & Replace")
     st.write("Find specific objects and replace them with something else")
@@ -556,18 +339,15 @@ def show_search_replace_tab(api_key, image):
     
     if st.button("Search & Replace", type="primary", key="search_replace_btn"):
         if search_prompt.strip() and replace_prompt.strip():
-            with st.spinner("Searching and replacing..."):
-                result = search_and_replace(api_key, image, search_prompt, replace_prompt, negative_prompt)
-                if result:
-                    st.image(result, caption=f"Replaced '{search_prompt}' with '{replace_prompt}'")
-                    
-                    buf = io.BytesIO()
-                    result.save(buf, format="PNG")
-                    st.download_button("Download Result", buf.getvalue(), "search_replace.png", "image/png")
+            submit_job("search_replace", f"Replaced '{search_prompt}' with '{replace_prompt}'", "search_replace",
+                       search_and_replace, api_key, payload, search_prompt, replace_prompt, negative_prompt,
+                       output_format=selected_output_format())
         else:
             st.warning("Please fill in both search and replace prompts")
+    
+    show_jobs("search_replace")
 
-def show_replace_background_tab(api_key, image):
+def show_replace_background_tab(api_key, payload):
     """Replace background tab"""
     st.subheader("Replace Background & Relight")
     st.write("Change the background and adjust lighting to match")
@@ -583,42 +363,29 @@ def show_replace_background_tab(api_key, image):
     
     if st.button("Replace Background", type="primary", key="replace_bg_btn"):
         if background_prompt.strip():
-            with st.spinner("Replacing background..."):
-                result = replace_background_and_relight(api_key, image, background_prompt, foreground_prompt, negative_prompt, preserve_subject)
-                if result:
-                    st.image(result, caption=f"New background: {background_prompt}")
-                    
-                    buf = io.BytesIO()
-                    result.save(buf, format="PNG")
-                    st.download_button("Download Result", buf.getvalue(), "new_background.png", "image/png")
+            submit_job("replace_background", f"New background: {background_prompt}", "new_background",
+                       replace_background_and_relight, api_key, payload, background_prompt, foreground_prompt,
+                       negative_prompt, preserve_subject, output_format=selected_output_format())
         else:
             st.warning("Please describe the new background")
+    
+    show_jobs("replace_background")
 
-def show_erase_object_tab(api_key, image):
+def show_erase_object_tab(api_key, payload):
     """Erase object tab"""
     st.subheader("Erase Object")
-    st.write("Paint white over objects you want to remove, then upload the mask")
-    
-    # Same white painting interface but for erasing
-    html_interface = create_white_painting_interface(image)
-    html(html_interface, height=700, scrolling=False)
+    st.write("Paint white over objects you want to remove")
     
-    mask_file = st.file_uploader(
-        "Upload mask (white = erase, black = keep):",
-        type=['png', 'jpg', 'jpeg'],
-        key="erase_mask"
-    )
+    mask_image = show_mask_input(payload, "erase", "Mask (white = erase, black = keep):")
     
-    if mask_file is not None:
-        mask_image = Image.open(mask_file)
-        st.image(mask_image, caption="Erase mask", width=300)
-        
+    if mask_image is not None:
+        roi = roi_option(payload, mask_image, "erase")
         if st.button("Erase Object", type="primary", key="erase_btn"):
-            with st.spinner("Erasing object..."):
-                result = erase_with_mask(api_key, image, mask_image)
-                if result:
-                    st.image(result, caption="Object erased")
-                    
-                    buf = io.BytesIO()
-                    result.save(buf, format="PNG")
-                    st.download_button("Download Result", buf.getvalue(), "erased.png", "image/png")
+            fn, args = erase_with_mask, (api_key, payload, mask_image)
+            if roi:
+                fn, args = edit_region, (fn,) + args
+            submit_job("erase", "Object erased", "erased", fn, *args,
+                       output_format=selected_output_format(),
+                       preview=local_preview(preview_inpaint, payload.image, mask_image))
+    
+    show_jobs("erase")
@@ -1,24 +1,65 @@
 import streamlit as st
-import requests
+from modules.utils import api_url, request_image_bytes, report_error, StabilityAPIError, DEFAULT_OUTPUT_FORMAT, selected_output_format
+from modules.payload import ImageResult
 import io
-from PIL import Image
 import random
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+from modules.jobs import submit_job, show_jobs, clear_jobs, JOB_POLL_SECONDS
 
-def generate_image(api_key, prompt, negative_prompt="", style="enhance", aspect_ratio="1:1", seed=None):
+MAX_SEED = 2147483647
+VARIANT_GRID_COLUMNS = 4
+
+STYLE_OPTIONS = {
+    "Auto Enhance": "enhance",
+    "🎨 Artistic": "anime",
+    "📸 Photographic": "photographic",
+    "🎭 Digital Art": "digital-art",
+    "🖼️ Fantasy Art": "fantasy-art",
+    "✏️ Line Art": "line-art",
+    "🎪 Analog Film": "analog-film",
+    "🌟 Neon Punk": "neon-punk",
+    "🏛️ Cinematic": "cinematic"
+}
+
+ASPECT_OPTIONS = {
+    "Square (1:1)": "1:1",
+    "Portrait (9:16)": "9:16",
+    "Landscape (16:9)": "16:9",
+    "Tall (9:21)": "9:21",
+    "Wide (21:9)": "21:9"
+}
+
+# Matrix mode: most cells per click and generations in flight at once (process-wide)
+MAX_MATRIX_CELLS = 30
+MATRIX_CONCURRENCY = 6
+CONTACT_CELL_SIZE = 192
+CONTACT_GAP = 6
+CONTACT_BACKGROUND = 24
+# Placeholder fill for cells without a thumbnail
+CELL_COLORS = {
+    "queued": (55, 55, 60),
+    "running": (70, 80, 110),
+    "failed": (120, 45, 45),
+    "cancelled": (40, 40, 40),
+    "expired": (40, 40, 40)
+}
+
+_matrix_executor = ThreadPoolExecutor(max_workers=MATRIX_CONCURRENCY, thread_name_prefix="matrix-job")
+
+def generate_image(api_key, prompt, negative_prompt="", style="enhance", aspect_ratio="1:1", seed=None,
+                   output_format=DEFAULT_OUTPUT_FORMAT):
     """Generate image using Stability AI API with advanced options"""
     
-    url = "https://api.stability.ai/v2beta/stable-image/generate/ultra"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
+    url = api_url("generate/ultra")
     
     # Prepare form data
     files = {
         "prompt": (None, prompt),
         "aspect_ratio": (None, aspect_ratio),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
     # Add optional parameters
@@ -32,18 +73,173 @@ def generate_image(api_key, prompt, negative_prompt="", style="enhance", aspect_
         files["seed"] = (None, str(seed))
     
     try:
-        response = requests.post(url, headers=headers, files=files)
-        
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
-            
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed is not None), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
+def make_seed_sweep(count, sequential=False, start_seed=None):
+    """Distinct random seeds, or consecutive seeds counting up from start_seed"""
+    if sequential:
+        start = start_seed or 0
+        return [(start + i) % (MAX_SEED + 1) for i in range(count)]
+    return random.sample(range(MAX_SEED + 1), count)
+
+def show_variant_result(job):
+    """One cell of the variant grid"""
+    result = job.result
+    st.image(result.display, caption=job.caption)
+    
+    st.download_button(
+        label="📥 Download",
+        data=result.data,
+        file_name=f"{job.filename}.{result.extension}",
+        mime=result.mime,
+        key=f"variant_download_{job.id}",
+        use_container_width=True
+    )
+
+def show_generated_result(job):
+    """Full result view for a single generation"""
+    image = job.result
+    details = job.details
+    
+    st.success("🎉 Image generated successfully!")
+    
+    # Display image with details
+    st.image(image.display, caption=job.caption)
+    
+    # Image details
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Width", image.size[0])
+    with col2:
+        st.metric("Height", image.size[1])
+    with col3:
+        st.metric("Pixels", f"{image.size[0] * image.size[1]:,}")
+    
+    # Download section
+    st.markdown("---")
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        filename = st.text_input(
+            "Filename:", 
+            value=job.filename,
+            help="Name for your download file",
+            key=f"generate_filename_{job.id}"
+        )
+    
+    with col2:
+        st.download_button(
+            label=f"📥 Download {image.extension.upper()}",
+            data=image.data,
+            file_name=f"{filename}.{image.extension}",
+            mime=image.mime,
+            use_container_width=True,
+            key=f"generate_download_{job.id}"
+        )
+    
+    # Generation details
+    with st.expander("📊 Generation Details"):
+        st.write(f"**Prompt:** {details['prompt']}")
+        if details["negative_prompt"]:
+            st.write(f"**Negative Prompt:** {details['negative_prompt']}")
+        st.write(f"**Style:** {details['style']}")
+        st.write(f"**Aspect Ratio:** {details['aspect']}")
+        if details["seed"] is not None:
+            st.write(f"**Seed:** {details['seed']}")
+        st.write(f"**Quality Preset:** {details['preset']}")
+
+def matrix_cells(styles, aspects, seeds):
+    """Every (style, aspect, seed) combination, one sheet row per style/seed pair and one column per aspect"""
+    return [(style, aspect, seed) for style, seed in itertools.product(styles, seeds) for aspect in aspects]
+
+def compose_contact_sheet(cells, rows, columns, cell_size=CONTACT_CELL_SIZE, gap=CONTACT_GAP):
+    """Lay out cells {(row, col): (thumbnail bytes or fill colour, label)} on one RGB array"""
+    pitch = cell_size + gap
+    sheet = np.full((rows * pitch + gap, columns * pitch + gap, 3), CONTACT_BACKGROUND, dtype=np.uint8)
+
+    for (row, col), (content, _) in cells.items():
+        top, left = gap + row * pitch, gap + col * pitch
+        if isinstance(content, tuple):
+            sheet[top:top + cell_size, left:left + cell_size] = content
+            continue
+        thumbnail = Image.open(io.BytesIO(content)).convert("RGB")
+        thumbnail.thumbnail((cell_size, cell_size))
+        pixels = np.asarray(thumbnail)
+        height, width = pixels.shape[:2]
+        y, x = top + (cell_size - height) // 2, left + (cell_size - width) // 2
+        sheet[y:y + height, x:x + width] = pixels
+
+    # Labels are the only part drawn with PIL
+    image = Image.fromarray(sheet)
+    draw = ImageDraw.Draw(image)
+    for (row, col), (_, label) in cells.items():
+        draw.text((gap + col * pitch + 4, gap + row * pitch + 4), label, fill=(255, 255, 255),
+                  stroke_width=2, stroke_fill=(0, 0, 0))
+    return image
+
+def _cell_content(job):
+    status = job.status
+    if status == "done" and job.expired:
+        status = "expired"
+    if status == "done":
+        # The thumbnail already lives in memory in the history store
+        return job.entry.thumbnail
+    return CELL_COLORS[status]
+
+def show_matrix_results():
+    """Contact sheet of the last matrix, filling in while jobs land; full size only when a cell is opened"""
+    matrix = st.session_state.get("generation_matrix")
+    if not matrix:
+        return
+
+    was_pending = any(job.pending for job in matrix["jobs"].values())
+
+    def render():
+        rows = [(style, seed) for style, seed in itertools.product(matrix["styles"], matrix["seeds"])]
+        cells = {}
+        for (style, aspect, seed), job in matrix["jobs"].items():
+            row, col = rows.index((style, seed)), matrix["aspects"].index(aspect)
+            # Drawn with PIL's default font, so stick to the plain-ASCII option values
+            cells[(row, col)] = (_cell_content(job), f"{STYLE_OPTIONS[style]} {ASPECT_OPTIONS[aspect]} #{seed}")
+
+        done = sum(job.status == "done" for job in matrix["jobs"].values())
+        st.image(compose_contact_sheet(cells, len(rows), len(matrix["aspects"])),
+                 caption=f"Contact sheet: {done}/{len(matrix['jobs'])} done · rows: style × seed, columns: aspect ratio")
+
+        pending = any(job.pending for job in matrix["jobs"].values())
+        if was_pending and not pending:
+            st.rerun()
+
+        finished = {f"{style} · {aspect} · seed {seed}": job for (style, aspect, seed), job in matrix["jobs"].items()
+                    if job.status == "done" and not job.expired}
+        if not finished:
+            return
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            label = st.selectbox("Open a cell:", list(finished), key="matrix_open_label")
+        with col2:
+            st.write("")
+            if st.button("🔍 Open full size", use_container_width=True, key="matrix_open"):
+                st.session_state.matrix_opened = finished[label].id
+
+        opened = next((job for job in finished.values() if job.id == st.session_state.get("matrix_opened")), None)
+        if opened is not None:
+            # Read back from the result store only now
+            result = opened.result
+            if result is not None:
+                st.image(result.display, caption=opened.caption)
+                st.download_button(f"📥 Download {result.extension.upper()}", result.data,
+                                   f"{opened.filename}.{result.extension}", result.mime,
+                                   key=f"matrix_download_{opened.id}")
+
+    st.fragment(run_every=JOB_POLL_SECONDS if was_pending else None)(render)()
+
 def show_generation_interface(api_key):
     """Show the enhanced generation interface"""
     
@@ -62,17 +258,7 @@ def show_generation_interface(api_key):
         
         with col1:
             st.subheader("Style Preset")
-            style_options = {
-                "Auto Enhance": "enhance",
-                "🎨 Artistic": "anime", 
-                "📸 Photographic": "photographic",
-                "🎭 Digital Art": "digital-art",
-                "🖼️ Fantasy Art": "fantasy-art",
-                "✏️ Line Art": "line-art",
-                "🎪 Analog Film": "analog-film",
-                "🌟 Neon Punk": "neon-punk",
-                "🏛️ Cinematic": "cinematic"
-            }
+            style_options = STYLE_OPTIONS
             
             selected_style = st.selectbox(
                 "Choose style:",
@@ -81,13 +267,7 @@ def show_generation_interface(api_key):
             )
             
             st.subheader("Aspect Ratio")
-            aspect_options = {
-                "Square (1:1)": "1:1",
-                "Portrait (9:16)": "9:16", 
-                "Landscape (16:9)": "16:9",
-                "Tall (9:21)": "9:21",
-                "Wide (21:9)": "21:9"
-            }
+            aspect_options = ASPECT_OPTIONS
             
             selected_aspect = st.selectbox(
                 "Choose aspect ratio:",
@@ -110,14 +290,14 @@ def show_generation_interface(api_key):
                 seed = st.number_input(
                     "Seed value:", 
                     min_value=0, 
-                    max_value=2147483647,
+                    max_value=MAX_SEED,
                     value=42,
                     help="Same seed + prompt = same image"
                 )
             else:
                 seed = None
                 if st.button("🎲 Generate Random Seed"):
-                    st.write(f"Random seed: {random.randint(0, 2147483647)}")
+                    st.write(f"Random seed: {random.randint(0, MAX_SEED)}")
     
     # Quality presets
     st.subheader("🏆 Quality Preset")
@@ -139,70 +319,109 @@ def show_generation_interface(api_key):
     preset = getattr(st.session_state, 'quality_preset', 'balanced')
     st.info(f"Current preset: **{preset.title()}**")
     
+    # Variants
+    st.subheader("🧬 Variants")
+    variant_mode = st.checkbox("Generate multiple variants", help="Run several seeds at once and compare them side by side")
+    
+    if variant_mode:
+        variant_col1, variant_col2 = st.columns(2)
+        with variant_col1:
+            variant_count = st.slider("Number of variants:", 2, 16, 4)
+        with variant_col2:
+            seed_sweep = st.radio(
+                "Seeds:",
+                ["Random", "Sequential"],
+                horizontal=True,
+                help="Sequential counts up from the custom seed (or 0)"
+            )
+    
+    # Matrix
+    st.subheader("🧮 Matrix")
+    matrix_mode = st.checkbox("Compare styles × aspect ratios × seeds",
+                              help="Generate every combination at once and lay them out on a contact sheet")
+    
+    if matrix_mode:
+        matrix_col1, matrix_col2, matrix_col3 = st.columns(3)
+        with matrix_col1:
+            matrix_styles = st.multiselect("Styles:", list(style_options.keys()), default=[selected_style])
+        with matrix_col2:
+            matrix_aspects = st.multiselect("Aspect ratios:", list(aspect_options.keys()), default=[selected_aspect])
+        with matrix_col3:
+            # The same seeds are used in every cell so styles/aspects are compared like for like
+            matrix_seed_count = st.slider("Seeds per combination:", 1, 4, 1)
+        matrix_size = len(matrix_styles) * len(matrix_aspects) * matrix_seed_count
+        st.caption(f"{matrix_size} images (at most {MAX_MATRIX_CELLS}), {MATRIX_CONCURRENCY} generated at a time")
+    
     # Generate button
     st.markdown("---")
     
     if st.button("🎨 Generate Image", type="primary", use_container_width=True):
-        if prompt.strip():
-            with st.spinner("Creating your masterpiece..."):
-                style_key = style_options[selected_style]
-                aspect_key = aspect_options[selected_aspect]
-                
-                image = generate_image(
-                    api_key=api_key,
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    style=style_key,
-                    aspect_ratio=aspect_key,
-                    seed=seed
+        style_key = style_options[selected_style]
+        aspect_key = aspect_options[selected_aspect]
+        
+        if prompt.strip() and matrix_mode:
+            if not matrix_styles or not matrix_aspects:
+                st.warning("⚠️ Pick at least one style and one aspect ratio.")
+            elif matrix_size > MAX_MATRIX_CELLS:
+                st.warning(f"⚠️ That is {matrix_size} images; the limit is {MAX_MATRIX_CELLS}.")
+            else:
+                clear_jobs("matrix")
+                seeds = make_seed_sweep(matrix_seed_count, seed is not None, seed)
+                jobs = {}
+                for style, aspect, cell_seed in matrix_cells(matrix_styles, matrix_aspects, seeds):
+                    jobs[(style, aspect, cell_seed)] = submit_job(
+                        "matrix",
+                        f"{style} | {aspect} | Seed: {cell_seed}",
+                        f"matrix_{style_options[style]}_{aspect_options[aspect].replace(':', 'x')}_{cell_seed}",
+                        generate_image,
+                        api_key, prompt, negative_prompt, style_options[style], aspect_options[aspect], cell_seed,
+                        output_format=selected_output_format(),
+                        executor=_matrix_executor
+                    )
+                st.session_state.generation_matrix = {
+                    "styles": matrix_styles,
+                    "aspects": matrix_aspects,
+                    "seeds": seeds,
+                    "jobs": jobs
+                }
+                st.session_state.pop("matrix_opened", None)
+        elif prompt.strip() and variant_mode:
+            clear_jobs("variant")
+            for variant_seed in make_seed_sweep(variant_count, seed_sweep == "Sequential", seed):
+                submit_job(
+                    "variant",
+                    f"Seed: {variant_seed}",
+                    f"variant_{style_key}_{variant_seed}",
+                    generate_image,
+                    api_key, prompt, negative_prompt, style_key, aspect_key, variant_seed,
+                    output_format=selected_output_format()
                 )
-                
-                if image:
-                    st.success("🎉 Image generated successfully!")
-                    
-                    # Display image with details
-                    st.image(image, caption=f"Style: {selected_style} | Aspect: {selected_aspect}")
-                    
-                    # Image details
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("Width", image.size[0])
-                    with col2:
-                        st.metric("Height", image.size[1])
-                    with col3:
-                        st.metric("Pixels", f"{image.size[0] * image.size[1]:,}")
-                    
-                    # Download section
-                    st.markdown("---")
-                    col1, col2 = st.columns([2, 1])
-                    
-                    with col1:
-                        filename = st.text_input(
-                            "Filename:", 
-                            value=f"generated_{style_key}_{aspect_key}",
-                            help="Name for your download file"
-                        )
-                    
-                    with col2:
-                        buf = io.BytesIO()
-                        image.save(buf, format="PNG")
-                        st.download_button(
-                            label="📥 Download PNG",
-                            data=buf.getvalue(),
-                            file_name=f"{filename}.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
-                    
-                    # Generation details
-                    with st.expander("📊 Generation Details"):
-                        st.write(f"**Prompt:** {prompt}")
-                        if negative_prompt:
-                            st.write(f"**Negative Prompt:** {negative_prompt}")
-                        st.write(f"**Style:** {selected_style}")
-                        st.write(f"**Aspect Ratio:** {selected_aspect}")
-                        if seed is not None:
-                            st.write(f"**Seed:** {seed}")
-                        st.write(f"**Quality Preset:** {preset}")
+        elif prompt.strip():
+            submit_job(
+                "generate",
+                f"Style: {selected_style} | Aspect: {selected_aspect}",
+                f"generated_{style_key}_{aspect_key}",
+                generate_image,
+                api_key=api_key,
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                style=style_key,
+                aspect_ratio=aspect_key,
+                seed=seed,
+                output_format=selected_output_format(),
+                details={
+                    "prompt": prompt,
+                    "negative_prompt": negative_prompt,
+                    "style": selected_style,
+                    "aspect": selected_aspect,
+                    "seed": seed,
+                    "preset": preset
+                }
+            )
         else:
             st.warning("⚠️ Please enter a prompt to generate an image.")
+    
+    # Results stream in as each job finishes
+    show_matrix_results()
+    show_jobs("variant", show_variant_result, columns=VARIANT_GRID_COLUMNS, newest_first=False)
+    show_jobs("generate", show_generated_result)
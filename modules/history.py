@@ -0,0 +1,205 @@
+import io
+import os
+import time
+import uuid
+import atexit
+import shutil
+import tempfile
+import itertools
+import threading
+from collections import OrderedDict
+import streamlit as st
+from modules.payload import ImageResult
+
+# Thumbnails stay in memory, full-resolution bytes are spilled under here (one subdirectory per process)
+HISTORY_DIR = os.environ.get(
+    "STABILITY_HISTORY_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai-image-studio", "history")
+)
+SESSION_MEMORY_BUDGET = int(os.environ.get("STABILITY_HISTORY_SESSION_MEMORY", str(4 * 1024 * 1024)))
+GLOBAL_MEMORY_BUDGET = int(os.environ.get("STABILITY_HISTORY_GLOBAL_MEMORY", str(256 * 1024 * 1024)))
+SESSION_DISK_BUDGET = int(os.environ.get("STABILITY_HISTORY_SESSION_DISK", str(512 * 1024 * 1024)))
+GLOBAL_DISK_BUDGET = int(os.environ.get("STABILITY_HISTORY_GLOBAL_DISK", str(8 * 1024 * 1024 * 1024)))
+
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 70
+HISTORY_COLUMNS = 4
+
+class HistoryEntry:
+    """One stored result: in-memory thumbnail plus full bytes on disk"""
+
+    def __init__(self, entry_id, session_id, label, thumbnail, path, disk_bytes, size, details):
+        self.id = entry_id
+        self.session_id = session_id
+        self.label = label
+        self.thumbnail = thumbnail
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.size = size
+        self.details = details
+        self.created = time.time()
+        self.last_viewed = self.created
+
+    @property
+    def memory_bytes(self):
+        return len(self.thumbnail)
+
+class ResultHistory:
+    """Process-wide result store with per-session and global budgets, evicting least recently viewed"""
+
+    def __init__(self, directory=HISTORY_DIR):
+        # Ordered by last view, oldest first
+        self._entries = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        # Other processes may share the parent directory, so this one only ever touches its own subdirectory
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=directory)
+        # Sessions don't survive a restart, so neither do their spilled files
+        atexit.register(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def add(self, session_id, result, label, details=None):
+        """Store a result, returning its entry"""
+        thumbnail = result.thumbnail(THUMBNAIL_SIZE)
+        if thumbnail.mode not in ("RGB", "RGBA"):
+            thumbnail = thumbnail.convert("RGBA" if "A" in thumbnail.getbands() else "RGB")
+        buf = io.BytesIO()
+        thumbnail.save(buf, format="WEBP", quality=THUMBNAIL_QUALITY)
+
+        with self._lock:
+            entry_id = next(self._ids)
+        path = os.path.join(self.directory, f"{entry_id}.{result.extension}")
+        result.save(path)
+
+        entry = HistoryEntry(entry_id, session_id, label, buf.getvalue(), path, len(result.data), result.size,
+                             details or {})
+        with self._lock:
+            self._entries[entry_id] = entry
+            self._evict(session_id)
+        return entry
+
+    def load(self, entry):
+        """Full-resolution result read back from disk, or None once evicted"""
+        with self._lock:
+            if entry.id not in self._entries:
+                return None
+            self._touch(entry)
+        try:
+            with open(entry.path, "rb") as f:
+                return ImageResult(f.read())
+        except OSError:
+            return None
+
+    def contains(self, entry):
+        with self._lock:
+            return entry.id in self._entries
+
+    def entries(self, session_id):
+        """A session's entries, newest first"""
+        with self._lock:
+            found = [entry for entry in self._entries.values() if entry.session_id == session_id]
+        return sorted(found, key=lambda entry: entry.created, reverse=True)
+
+    def stats(self, session_id=None):
+        with self._lock:
+            entries = list(self._entries.values())
+        mine = [entry for entry in entries if entry.session_id == session_id]
+        return {
+            "entries": len(mine),
+            "session_memory": sum(entry.memory_bytes for entry in mine),
+            "session_disk": sum(entry.disk_bytes for entry in mine),
+            "global_memory": sum(entry.memory_bytes for entry in entries),
+            "global_disk": sum(entry.disk_bytes for entry in entries)
+        }
+
+    def _touch(self, entry):
+        entry.last_viewed = time.time()
+        self._entries.move_to_end(entry.id)
+
+    def _drop(self, entry):
+        if self._entries.pop(entry.id, None) is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _evict(self, session_id):
+        mine = [entry for entry in self._entries.values() if entry.session_id == session_id]
+        memory = sum(entry.memory_bytes for entry in mine)
+        disk = sum(entry.disk_bytes for entry in mine)
+        # Keep the newest entry even if it alone is over budget
+        while len(mine) > 1 and (memory > SESSION_MEMORY_BUDGET or disk > SESSION_DISK_BUDGET):
+            oldest = mine.pop(0)
+            memory -= oldest.memory_bytes
+            disk -= oldest.disk_bytes
+            self._drop(oldest)
+
+        memory = sum(entry.memory_bytes for entry in self._entries.values())
+        disk = sum(entry.disk_bytes for entry in self._entries.values())
+        while len(self._entries) > 1 and (memory > GLOBAL_MEMORY_BUDGET or disk > GLOBAL_DISK_BUDGET):
+            oldest = next(iter(self._entries.values()))
+            memory -= oldest.memory_bytes
+            disk -= oldest.disk_bytes
+            self._drop(oldest)
+
+_history = None
+_history_lock = threading.Lock()
+
+def get_history():
+    """Return the process-wide result history"""
+    global _history
+
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = ResultHistory()
+    return _history
+
+def history_session_id():
+    """Stable id for this browser session's history"""
+    if "history_session_id" not in st.session_state:
+        st.session_state.history_session_id = uuid.uuid4().hex
+    return st.session_state.history_session_id
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+def show_history_usage():
+    """Sidebar summary of history memory/disk usage"""
+    stats = get_history().stats(history_session_id())
+    st.sidebar.caption(
+        f"History: {stats['entries']} results · {format_bytes(stats['session_memory'])} memory / "
+        f"{format_bytes(stats['session_disk'])} disk (server: {format_bytes(stats['global_memory'])} / "
+        f"{format_bytes(stats['global_disk'])})"
+    )
+
+def show_history_interface():
+    """Thumbnail gallery of this session's results; full resolution is loaded only when opened"""
+    history = get_history()
+    entries = history.entries(history_session_id())
+    if not entries:
+        st.info("No results yet. Generated and edited images will appear here.")
+        return
+
+    opened_id = st.session_state.get("history_opened")
+    opened = next((entry for entry in entries if entry.id == opened_id), None)
+    if opened is not None:
+        result = history.load(opened)
+        if result is not None:
+            st.subheader(opened.label)
+            st.image(result.display, caption=f"{opened.size[0]}x{opened.size[1]} · {format_bytes(opened.disk_bytes)}")
+            st.download_button(f"Download {result.extension.upper()}", result.data,
+                               f"result_{opened.id}.{result.extension}", result.mime, key="history_download")
+            st.markdown("---")
+
+    columns = st.columns(HISTORY_COLUMNS)
+    for index, entry in enumerate(entries):
+        with columns[index % HISTORY_COLUMNS]:
+            st.image(entry.thumbnail, caption=entry.label)
+            if st.button("Open", key=f"history_open_{entry.id}", use_container_width=True):
+                st.session_state.history_opened = entry.id
+                st.rerun()
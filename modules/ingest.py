@@ -0,0 +1,104 @@
+import io
+import os
+import math
+import streamlit as st
+from PIL import Image, ImageOps
+from modules.payload import ImagePayload
+
+# Refuse to decode anything bigger than this (decompression-bomb guard)
+MAX_DECODE_PIXELS = 200_000_000
+Image.MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+
+# Largest input (total pixels) each endpoint accepts
+ENDPOINT_MAX_PIXELS = {
+    "search-and-replace": 9_437_184,
+    "erase": 9_437_184,
+    "inpaint": 9_437_184,
+    "replace-background-and-relight": 9_437_184,
+    "remove-background": 4_194_304,
+    "upscale/conservative": 9_437_184
+}
+EDIT_MAX_PIXELS = max(ENDPOINT_MAX_PIXELS[name] for name in ENDPOINT_MAX_PIXELS if name != "upscale/conservative")
+# Edit page uploads are kept up to this size so region edits can be pasted back at full resolution;
+# whole-image calls still go through fit_payload
+SOURCE_MAX_PIXELS = int(os.environ.get("STABILITY_SOURCE_MAX_PIXELS", "25000000"))
+
+# Modes the endpoints take as-is; everything else is converted
+UPLOAD_MODES = ("RGB", "RGBA", "L")
+EXIF_ORIENTATION = 0x0112
+
+def _target_size(size, max_pixels):
+    width, height = size
+    if width * height <= max_pixels:
+        return size
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def _convert_mode(image):
+    if image.mode in UPLOAD_MODES:
+        return image
+    has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+def normalize_upload(data, max_pixels):
+    """Decode upload bytes at (close to) target size with orientation and mode fixed up"""
+    probe = Image.open(io.BytesIO(data))
+    width, height = probe.size
+    if width * height > MAX_DECODE_PIXELS:
+        raise ValueError(f"Image is too large to process ({width}x{height})")
+
+    target = _target_size(probe.size, max_pixels)
+    orientation = probe.getexif().get(EXIF_ORIENTATION, 1)
+
+    # Already within limits, upright and in a usable mode: ship the original bytes untouched
+    if target == probe.size and orientation == 1 and probe.mode in UPLOAD_MODES:
+        return ImagePayload.from_bytes(data)
+
+    source_format = probe.format
+    image = probe
+    if target != probe.size:
+        if source_format == "JPEG":
+            # Let libjpeg decode straight at 1/2, 1/4 or 1/8 scale (never below target)
+            image.draft("RGB", target)
+        else:
+            factor = int(min(width / target[0], height / target[1]))
+            if factor >= 2:
+                # reduce() has no palette or 1-bit support, so those are converted first
+                if image.mode in ("P", "1"):
+                    image = _convert_mode(image)
+                image = image.reduce(factor)
+
+    image = ImageOps.exif_transpose(image)
+    image = _convert_mode(image)
+
+    target = _target_size(image.size, max_pixels)
+    if target != image.size:
+        image = image.resize(target, Image.Resampling.LANCZOS)
+
+    preferred_format = "JPEG" if source_format == "JPEG" and image.mode != "RGBA" else "PNG"
+    return ImagePayload.from_image(image, preferred_format=preferred_format)
+
+def fit_payload(payload, max_pixels):
+    """Return the payload itself if within max_pixels, else a cached downscaled copy"""
+    if payload.size[0] * payload.size[1] <= max_pixels:
+        return payload
+
+    if max_pixels not in payload.derived:
+        image = payload.image
+        resized = image.resize(_target_size(image.size, max_pixels), Image.Resampling.LANCZOS)
+        preferred_format = payload.preferred_format or payload.source_format
+        if preferred_format == "JPEG" and resized.mode == "RGBA":
+            preferred_format = "PNG"
+        payload.derived[max_pixels] = ImagePayload.from_image(resized, preferred_format=preferred_format)
+    return payload.derived[max_pixels]
+
+def get_session_payload(uploaded_file, state_key, max_pixels=EDIT_MAX_PIXELS):
+    """Return the normalized payload for an upload, reusing it across reruns while the file is unchanged"""
+    file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+    cached = st.session_state.get(state_key)
+    if cached is not None and cached[0] == file_id:
+        return cached[1]
+
+    payload = normalize_upload(uploaded_file.getvalue(), max_pixels)
+    st.session_state[state_key] = (file_id, payload)
+    return payload
@@ -0,0 +1,194 @@
+import os
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from modules.utils import capture_errors
+from modules.history import get_history, history_session_id
+
+# Worker pool shared by every session; the rate limiter paces the actual API calls
+JOB_WORKERS = int(os.environ.get("STABILITY_JOB_WORKERS", "16"))
+JOB_POLL_SECONDS = 1.0
+# Set STABILITY_PREVIEW_GRACE_SECONDS to hold jobs with a local preview that long before calling the API,
+# so a bad edit can be cancelled for free (off by default: it delays every such result)
+PREVIEW_GRACE_SECONDS = float(os.environ.get("STABILITY_PREVIEW_GRACE_SECONDS", "0"))
+MAX_JOBS_PER_SESSION = 30
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="stability-job")
+_job_ids = itertools.count(1)
+_job_ids_lock = threading.Lock()
+
+class Job:
+    """Handle for one background API call"""
+
+    def __init__(self, kind, caption, filename, details=None, preview=None, grace=0.0, session_id=None):
+        with _job_ids_lock:
+            self.id = next(_job_ids)
+        self.kind = kind
+        self.caption = caption
+        self.filename = filename
+        self.details = details or {}
+        self.preview = preview
+        self.grace = grace
+        self.session_id = session_id
+        self.cancel_requested = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.errors = []
+        self.future = None
+
+    @property
+    def status(self):
+        if self.future.cancelled() or (self.cancel_requested.is_set() and self.started is None):
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.started else "queued"
+        if self.future.exception() is not None or self.future.result() is None:
+            return "failed"
+        return "done"
+
+    @property
+    def entry(self):
+        """History entry holding the result (the job itself keeps no image bytes)"""
+        if self.future.done() and not self.future.cancelled() and self.future.exception() is None:
+            return self.future.result()
+        return None
+
+    @property
+    def result(self):
+        """Full-resolution result, read back from the history store"""
+        entry = self.entry
+        return get_history().load(entry) if entry is not None else None
+
+    @property
+    def expired(self):
+        entry = self.entry
+        return entry is not None and not get_history().contains(entry)
+
+    @property
+    def pending(self):
+        return not self.future.done()
+
+    @property
+    def error_message(self):
+        if self.errors:
+            return "; ".join(self.errors)
+        if self.future.done() and not self.future.cancelled() and self.future.exception() is not None:
+            return f"Request failed: {str(self.future.exception())}"
+        return "No result returned"
+
+    def cancel(self):
+        """Cancel a job that hasn't called the API yet (started calls can't be recalled)"""
+        self.cancel_requested.set()
+        return self.future.cancel() or self.started is None
+
+def _run(job, fn, args, kwargs):
+    if job.grace and job.cancel_requested.wait(job.grace):
+        return None
+    if job.cancel_requested.is_set():
+        return None
+    job.started = time.time()
+    try:
+        with capture_errors() as errors:
+            result = fn(*args, **kwargs)
+        if result is None:
+            return None
+        # Results live in the history store: thumbnail in memory, full bytes on disk
+        return get_history().add(job.session_id, result, job.caption, job.details)
+    finally:
+        job.errors = errors
+        job.finished = time.time()
+
+def submit_job(kind, caption, filename, fn, *args, details=None, preview=None, executor=None, **kwargs):
+    """Queue fn(*args, **kwargs) on the worker pool (or a narrower executor) and track it in this session"""
+    # With a grace period configured, a job shipped with a local preview holds off so the user can cancel before paying
+    grace = PREVIEW_GRACE_SECONDS if preview is not None else 0.0
+    job = Job(kind, caption, filename, details, preview, grace, history_session_id())
+    job.future = (executor or _executor).submit(_run, job, fn, args, kwargs)
+
+    jobs = st.session_state.setdefault("jobs", [])
+    jobs.append(job)
+    # Drop the oldest finished jobs once the session holds too many
+    while len(jobs) > MAX_JOBS_PER_SESSION:
+        finished = [old for old in jobs if not old.pending]
+        if not finished:
+            break
+        jobs.remove(finished[0])
+    return job
+
+def session_jobs(kind=None):
+    """Jobs submitted by this session, oldest first"""
+    jobs = st.session_state.get("jobs", [])
+    if kind is None:
+        return list(jobs)
+    return [job for job in jobs if job.kind == kind]
+
+def clear_jobs(kind):
+    """Forget finished jobs of one kind"""
+    st.session_state["jobs"] = [job for job in session_jobs() if job.kind != kind or job.pending]
+
+def show_job_result(job):
+    """Default renderer: result image plus a download button"""
+    result = job.result
+    st.image(result.display, caption=job.caption)
+    # Serve the API's bytes as-is; nothing is decoded or recompressed for the download
+    st.download_button(f"Download {result.extension.upper()}", result.data, f"{job.filename}.{result.extension}",
+                       result.mime, key=f"job_download_{job.id}")
+
+def show_job(job, render_result=show_job_result):
+    status = job.status
+    if status == "done" and job.expired:
+        st.caption(f"🗑️ {job.caption} (dropped from history to free space)")
+    elif status == "done":
+        render_result(job)
+    elif status == "failed":
+        st.error(f"{job.caption}: {job.error_message}")
+    elif status == "cancelled":
+        st.caption(f"🚫 {job.caption} (cancelled)")
+    else:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            waited = time.time() - (job.started or job.submitted)
+            if status == "running":
+                st.info(f"⏳ Running: {job.caption} ({waited:.0f}s)")
+            elif job.grace and waited < job.grace:
+                st.info(f"⏳ Sending in {job.grace - waited:.0f}s: {job.caption} (cancel now to skip the charge)")
+            else:
+                st.info(f"⏳ Queued: {job.caption} ({waited:.0f}s)")
+        with col2:
+            if status == "queued" and st.button("Cancel", key=f"job_cancel_{job.id}"):
+                job.cancel()
+                st.rerun()
+        if job.preview is not None:
+            st.image(job.preview, caption="Instant local preview (approximate)", width=300)
+
+def show_jobs(kind, render_result=show_job_result, newest_first=True, columns=None):
+    """Show this session's jobs of one kind, polling while any are still in flight"""
+    if not session_jobs(kind):
+        return
+
+    was_pending = any(job.pending for job in session_jobs(kind))
+
+    def render():
+        jobs = session_jobs(kind)
+        ordered = list(reversed(jobs)) if newest_first else jobs
+        if columns:
+            grid = st.columns(columns)
+            for index, job in enumerate(ordered):
+                with grid[index % columns]:
+                    show_job(job, render_result)
+        else:
+            for job in ordered:
+                show_job(job, render_result)
+
+        pending = any(job.pending for job in jobs)
+        if was_pending and not pending:
+            # Everything landed: one full rerun swaps this for a non-polling fragment
+            st.rerun()
+        if not pending and st.button("Clear results", key=f"clear_jobs_{kind}"):
+            clear_jobs(kind)
+            st.rerun()
+
+    st.fragment(run_every=JOB_POLL_SECONDS if was_pending else None)(render)()
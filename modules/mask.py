@@ -0,0 +1,102 @@
+import numpy as np
+from PIL import Image
+
+# A painted pixel must be this bright on every channel...
+WHITE_THRESHOLD = 235
+# ...and differ from the original by at least this much on some channel
+DIFF_THRESHOLD = 40
+# Share of pixels that must be near-black/near-white for an upload to count as a ready mask
+BINARY_RATIO = 0.98
+# Set in the info of soft masks made by finish_mask, so they aren't mistaken for painted grayscale photos
+PREPARED_MASK_INFO = "prepared_mask"
+
+def _to_rgb_array(image, size=None):
+    import cv2
+    rgb = np.asarray(image.convert("RGB"))
+    if size is not None and image.size != size:
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+    return rgb
+
+def finish_mask(mask, dilate=0, feather=0):
+    """Grow and soften a uint8 0/255 mask, returning a compact PIL mask"""
+    import cv2
+    if dilate > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * dilate + 1, 2 * dilate + 1))
+        mask = cv2.dilate(mask, kernel)
+
+    if feather > 0:
+        mask = cv2.GaussianBlur(mask, (0, 0), sigmaX=feather)
+        soft = Image.fromarray(mask, mode="L")
+        soft.info[PREPARED_MASK_INFO] = True
+        return soft
+
+    # Hard masks go out as 1-bit PNGs, which compress to almost nothing
+    return Image.fromarray(mask > 127).convert("1")
+
+def extract_white_mask(original, painted, white_threshold=WHITE_THRESHOLD, diff_threshold=DIFF_THRESHOLD,
+                       dilate=0, feather=0):
+    """Mask of the white strokes added on top of the original image"""
+    original_rgb = _to_rgb_array(original)
+    painted_rgb = _to_rgb_array(painted, size=original.size)
+
+    diff = np.abs(painted_rgb.astype(np.int16) - original_rgb.astype(np.int16)).max(axis=2)
+    white = painted_rgb.min(axis=2) >= white_threshold
+    mask = ((diff >= diff_threshold) & white).astype(np.uint8) * 255
+
+    return finish_mask(mask, dilate, feather)
+
+def is_prepared_mask(image):
+    """True for masks usable as-is: 1-bit, strictly 0/255 grayscale, or made by finish_mask"""
+    if image.mode == "1" or image.info.get(PREPARED_MASK_INFO):
+        return True
+    # A grayscale photo with white paint on it is "L" too, so only pure black/white counts
+    return image.mode == "L" and not any(image.histogram()[1:255])
+
+def is_binary_mask(image):
+    """True when the image is already a black/white mask rather than a painted photo"""
+    if is_prepared_mask(image):
+        return True
+
+    gray = np.asarray(image.convert("L"))
+    extreme = np.count_nonzero((gray < 16) | (gray > 239))
+    return extreme >= BINARY_RATIO * gray.size
+
+def rasterize_strokes(strokes, canvas_size, size):
+    """Draw brush strokes recorded on a canvas_size preview as a full-resolution "L" mask of the given size"""
+    import cv2
+    canvas_width, canvas_height = canvas_size
+    width, height = size
+    scale = np.array([width / canvas_width, height / canvas_height])
+    brush_scale = min(scale)
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for stroke in strokes:
+        if not stroke.get("points"):
+            continue
+        points = np.round(np.asarray(stroke["points"], dtype=np.float64) * scale).astype(np.int32)
+        thickness = max(1, int(round(stroke["size"] * brush_scale)))
+        # No anti-aliasing: the mask stays strictly 0/255, like one painted and uploaded
+        if len(points) > 1:
+            cv2.polylines(mask, [points.reshape(-1, 1, 2)], False, 255, thickness, lineType=cv2.LINE_8)
+        for x, y in points:
+            cv2.circle(mask, (int(x), int(y)), max(1, thickness // 2), 255, -1, lineType=cv2.LINE_8)
+    return Image.fromarray(mask, mode="L")
+
+def prepare_mask(original, upload, dilate=0, feather=0):
+    """Turn a mask or painted upload into a mask matching the original's size"""
+    import cv2
+    # Already-prepared masks pass straight through, resized if made for another copy of the image
+    if is_prepared_mask(upload) and not dilate and not feather:
+        if upload.size != original.size:
+            resample = Image.Resampling.NEAREST if upload.mode == "1" else Image.Resampling.BILINEAR
+            upload = upload.resize(original.size, resample)
+        return upload
+
+    if is_binary_mask(upload):
+        gray = np.asarray(upload.convert("L"))
+        if upload.size != original.size:
+            gray = cv2.resize(gray, original.size, interpolation=cv2.INTER_NEAREST)
+        mask = (gray > 127).astype(np.uint8) * 255
+        return finish_mask(mask, dilate, feather)
+
+    return extract_white_mask(original, upload, dilate=dilate, feather=feather)
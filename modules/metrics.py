@@ -0,0 +1,193 @@
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set STABILITY_METRICS_FILE to also write the Prometheus text after every call,
+# and/or STABILITY_METRICS_PORT to serve it at http://<host>:<port>/metrics
+METRICS_FILE = os.environ.get("STABILITY_METRICS_FILE")
+METRICS_PORT = os.environ.get("STABILITY_METRICS_PORT")
+
+PHASES = ("encode", "upload", "wait", "download", "decode", "total")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th quantile (Prometheus-style estimate)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """Per-endpoint latency histograms by phase plus byte/status/retry counters"""
+
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.bytes_out = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.coalesced = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, phase, seconds):
+        with self._lock:
+            self.latency[(endpoint, phase)].observe(seconds)
+
+    def record_call(self, endpoint, status, bytes_out=0, bytes_in=0, retries=0):
+        with self._lock:
+            self.statuses[(endpoint, str(status))] += 1
+            self.bytes_out[endpoint] += bytes_out
+            self.bytes_in[endpoint] += bytes_in
+            self.retries[endpoint] += retries
+
+    def record_cache_hit(self, endpoint):
+        with self._lock:
+            self.cache_hits[endpoint] += 1
+
+    def record_coalesced(self, endpoint):
+        with self._lock:
+            self.coalesced[endpoint] += 1
+
+    def summary(self):
+        """Rows for the sidebar panel, one per endpoint"""
+        with self._lock:
+            endpoints = sorted({endpoint for endpoint, _ in self.latency} | set(self.bytes_out))
+            rows = []
+            for endpoint in endpoints:
+                total = self.latency.get((endpoint, "total"))
+                row = {"endpoint": endpoint, "calls": total.count if total else 0}
+                for phase in PHASES:
+                    histogram = self.latency.get((endpoint, phase))
+                    row[f"{phase} ms"] = round(1000 * histogram.sum / histogram.count) if histogram and histogram.count else None
+                row["p95 s"] = total.quantile(0.95) if total else None
+                row["KB out"] = round(self.bytes_out[endpoint] / 1024)
+                row["KB in"] = round(self.bytes_in[endpoint] / 1024)
+                row["retries"] = self.retries[endpoint]
+                row["errors"] = sum(count for (name, status), count in self.statuses.items()
+                                    if name == endpoint and status != "200")
+                row["cache hits"] = self.cache_hits[endpoint]
+                row["shared"] = self.coalesced[endpoint]
+                rows.append(row)
+            return rows
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP stability_request_seconds Stability API call latency by phase",
+            "# TYPE stability_request_seconds histogram"
+        ]
+        with self._lock:
+            for (endpoint, phase), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                for bound, cumulative in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'stability_request_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'stability_request_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"stability_request_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"stability_request_seconds_count{{{labels}}} {histogram.count}")
+
+            counters = [
+                ("stability_request_bytes_out_total", "Bytes uploaded", self.bytes_out),
+                ("stability_response_bytes_in_total", "Bytes downloaded", self.bytes_in),
+                ("stability_retries_total", "Retried attempts", self.retries),
+                ("stability_cache_hits_total", "Calls answered from the result cache", self.cache_hits),
+                ("stability_coalesced_total", "Calls that joined an identical in-flight request", self.coalesced)
+            ]
+            for name, help_text, values in counters:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+            lines.append("# HELP stability_responses_total Responses by status code")
+            lines.append("# TYPE stability_responses_total counter")
+            for (endpoint, status), value in sorted(self.statuses.items()):
+                lines.append(f'stability_responses_total{{endpoint="{endpoint}",status="{status}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+_pending_encode = threading.local()
+_server_lock = threading.Lock()
+_server = None
+_file_lock = threading.Lock()
+
+def endpoint_name(url):
+    """Short label for an endpoint URL, e.g. 'edit/erase'"""
+    return url.split("/stable-image/", 1)[-1]
+
+def add_encode_time(seconds):
+    """Credit input encoding to the next API call made on this thread"""
+    _pending_encode.seconds = getattr(_pending_encode, "seconds", 0.0) + seconds
+
+def take_encode_time():
+    seconds = getattr(_pending_encode, "seconds", 0.0)
+    _pending_encode.seconds = 0.0
+    return seconds
+
+def write_metrics_file(path=METRICS_FILE):
+    """Atomically rewrite the metrics file; best effort, a failed write never fails the API call"""
+    if not path:
+        return
+    with _file_lock:
+        tmp_path = None
+        try:
+            # Unique temp name in the same directory, so other processes writing the same file can't collide
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(registry.render_prometheus())
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a background thread (once per process)"""
+    global _server
+
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
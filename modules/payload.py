@@ -0,0 +1,186 @@
+import io
+import hashlib
+import time
+import threading
+from PIL import Image
+from modules.metrics import registry, endpoint_name, add_encode_time
+
+# Formats the Stability edit endpoints accept as-is
+UPLOAD_MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp"
+}
+JPEG_QUALITY = 95
+# Quality for results we encode ourselves (e.g. stitched tiles) in lossy formats
+LOCAL_QUALITY = 90
+# PIL encoder for each API output format, for results composed locally (tiled upscale, ROI edits)
+LOCAL_ENCODE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+# Largest side each lossy encoder can write
+MAX_ENCODE_SIDE = {"WEBP": 16383, "JPEG": 65535}
+
+def local_encode_format(output_format, image):
+    """PIL encoder for a locally composed result, falling back when the image is too large for the requested one"""
+    format = LOCAL_ENCODE_FORMATS[output_format]
+    if max(image.size) <= MAX_ENCODE_SIDE.get(format, max(image.size)):
+        return format
+    # JPEG keeps oversized RGB output small; anything with alpha (or too big even for JPEG) goes to PNG
+    if image.mode in ("RGB", "L") and max(image.size) <= MAX_ENCODE_SIDE["JPEG"]:
+        return "JPEG"
+    return "PNG"
+
+class ImagePayload:
+    """Image bytes hashed once, decoded once and encoded at most once per format"""
+
+    def __init__(self, data=None, image=None, preferred_format=None):
+        if data is None and image is None:
+            raise ValueError("ImagePayload needs either bytes or a PIL image")
+        self.data = data
+        self.preferred_format = preferred_format
+        # Resized variants keyed by pixel limit, see modules.ingest.fit_payload
+        self.derived = {}
+        self._image = image
+        self._digest = None
+        self._source_format = None
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data=bytes(data))
+
+    @classmethod
+    def from_image(cls, image, preferred_format=None):
+        return cls(image=image, preferred_format=preferred_format)
+
+    @property
+    def digest(self):
+        """SHA-256 of the original bytes (or of the raw pixels for in-memory images)"""
+        if self._digest is None:
+            digest = hashlib.sha256()
+            if self.data is not None:
+                digest.update(self.data)
+            else:
+                digest.update(f"{self._image.mode}:{self._image.size}".encode())
+                digest.update(self._image.tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    @property
+    def source_format(self):
+        """PIL format name of the original bytes, read from the header only"""
+        if self._source_format is None and self.data is not None:
+            with Image.open(io.BytesIO(self.data)) as probe:
+                self._source_format = probe.format
+        return self._source_format
+
+    @property
+    def image(self):
+        """Decoded PIL image, decoded on first access only"""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = Image.open(io.BytesIO(self.data))
+                    image.load()
+                    self._image = image
+        return self._image
+
+    def thumbnail(self, size):
+        """Copy fitting in size x size, made without a full-resolution copy of the pixels"""
+        image = self._image
+        if image is None:
+            image = Image.open(io.BytesIO(self.data))
+            # JPEG can decode straight at a reduced scale
+            image.draft(image.mode, (size, size))
+        scale = min(1.0, size / max(image.size))
+        target = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        # reducing_gap shrinks by whole factors with reduce() first, so the resample only sees a small image
+        return image.resize(target, Image.Resampling.BICUBIC, reducing_gap=2.0)
+
+    @property
+    def display(self):
+        """Something st.image can show without re-encoding: original bytes when we have them"""
+        return self.data if self.data is not None else self.image
+
+    @property
+    def size(self):
+        if self._image is None and self.data is not None:
+            with Image.open(io.BytesIO(self.data)) as probe:
+                return probe.size
+        return self._image.size
+
+    def encoded(self, formats=("PNG", "JPEG", "WEBP")):
+        """Return (bytes, mime) in an accepted format, passing original bytes through untouched"""
+        if self.data is not None and self.source_format in formats:
+            return self.data, UPLOAD_MIME_TYPES.get(self.source_format, "image/png")
+
+        fmt = self.preferred_format if self.preferred_format in formats else formats[0]
+        with self._lock:
+            if fmt not in self._encoded:
+                started = time.perf_counter()
+                buf = io.BytesIO()
+                image = self._image if self._image is not None else Image.open(io.BytesIO(self.data))
+                if fmt == "JPEG":
+                    if image.mode not in ("RGB", "L"):
+                        image = image.convert("RGB")
+                    image.save(buf, format=fmt, quality=JPEG_QUALITY)
+                else:
+                    image.save(buf, format=fmt)
+                self._encoded[fmt] = buf.getvalue()
+                add_encode_time(time.perf_counter() - started)
+        return self._encoded[fmt], UPLOAD_MIME_TYPES.get(fmt, "image/png")
+
+    def file_field(self, filename="image", formats=("PNG", "JPEG", "WEBP")):
+        """Multipart file tuple for requests' files= argument"""
+        data, mime = self.encoded(formats)
+        return (f"{filename}.{mime.split('/')[1]}", data, mime)
+
+def as_payload(image):
+    """Wrap a PIL image (or pass an existing payload through) for upload"""
+    if isinstance(image, ImagePayload):
+        return image
+    return ImagePayload.from_image(image)
+
+class ImageResult(ImagePayload):
+    """API response kept as the original bytes; pixels are decoded only when something needs them"""
+
+    def __init__(self, data, url=None):
+        super().__init__(data=data)
+        # Set for API responses so first decode is recorded against the endpoint
+        self.endpoint = endpoint_name(url) if url else None
+
+    @property
+    def image(self):
+        if self._image is None and self.endpoint is not None:
+            started = time.perf_counter()
+            image = super().image
+            registry.observe(self.endpoint, "decode", time.perf_counter() - started)
+            return image
+        return super().image
+
+    @classmethod
+    def from_image(cls, image, format="PNG", quality=LOCAL_QUALITY):
+        """Wrap a locally produced image, encoding it exactly once"""
+        buf = io.BytesIO()
+        if format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if format in ("JPEG", "WEBP"):
+            image.save(buf, format=format, quality=quality)
+        else:
+            image.save(buf, format=format)
+        result = cls(buf.getvalue())
+        result._image = image
+        return result
+
+    @property
+    def mime(self):
+        return UPLOAD_MIME_TYPES.get(self.source_format, "application/octet-stream")
+
+    @property
+    def extension(self):
+        return {"JPEG": "jpg"}.get(self.source_format, (self.source_format or "bin").lower())
+
+    def save(self, path):
+        """Write the response bytes as-is (no decode/re-encode)"""
+        with open(path, "wb") as f:
+            f.write(self.data)
@@ -0,0 +1,267 @@
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import streamlit as st
+from PIL import Image
+from modules.utils import report_error, capture_errors, selected_output_format
+from modules.ingest import get_session_payload
+from modules.edit import (
+    search_and_replace,
+    erase_with_mask,
+    replace_background_and_relight,
+    remove_background
+)
+from modules.upscale import upscale_image
+from modules.jobs import submit_job, show_jobs
+
+# Step input that refers to the pipeline's own input image
+SOURCE = "source"
+MAX_PARALLEL_STEPS = 4
+
+# op -> (function, needs the run's mask)
+PIPELINE_OPERATIONS = {
+    "remove-background": (remove_background, False),
+    "replace-background": (replace_background_and_relight, False),
+    "search-and-replace": (search_and_replace, False),
+    "erase": (erase_with_mask, True),
+    "upscale": (upscale_image, False)
+}
+
+PIPELINE_PRESETS = {
+    "Cut out → new background → upscale": [
+        {"id": "cutout", "op": "remove-background"},
+        {"id": "studio", "op": "replace-background", "input": "cutout",
+         "params": {"background_prompt": "clean white studio backdrop, soft light"}},
+        {"id": "final", "op": "upscale", "input": "studio"}
+    ],
+    "Three background variants": [
+        {"id": "cutout", "op": "remove-background"},
+        {"id": "beach", "op": "replace-background", "input": "cutout",
+         "params": {"background_prompt": "sunny beach at golden hour"}},
+        {"id": "office", "op": "replace-background", "input": "cutout",
+         "params": {"background_prompt": "modern bright office"}},
+        {"id": "forest", "op": "replace-background", "input": "cutout",
+         "params": {"background_prompt": "misty pine forest"}}
+    ],
+    "Erase → upscale": [
+        {"id": "cleaned", "op": "erase"},
+        {"id": "final", "op": "upscale", "input": "cleaned"}
+    ]
+}
+
+class PipelineStep:
+    def __init__(self, step_id, op, input=SOURCE, params=None):
+        self.id = step_id
+        self.op = op
+        self.input = input
+        self.params = params or {}
+
+class Pipeline:
+    """Validated DAG of edit steps; each step reads one earlier step's output (or the source image)"""
+
+    def __init__(self, steps):
+        self.steps = {}
+        for step in steps:
+            if step.id in self.steps or step.id == SOURCE:
+                raise ValueError(f"Duplicate or reserved step id '{step.id}'")
+            if step.op not in PIPELINE_OPERATIONS:
+                raise ValueError(f"Step '{step.id}': unknown operation '{step.op}'")
+            self.steps[step.id] = step
+
+        for step in self.steps.values():
+            if step.input != SOURCE and step.input not in self.steps:
+                raise ValueError(f"Step '{step.id}': unknown input '{step.input}'")
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Build from a list of {"id", "op", "input", "params"} dicts (or {"steps": [...]}), as parsed from JSON"""
+        if isinstance(spec, dict):
+            spec = spec.get("steps", [])
+        if not isinstance(spec, list) or not spec:
+            raise ValueError("A pipeline needs a non-empty list of steps")
+        steps = []
+        for index, entry in enumerate(spec, 1):
+            if not isinstance(entry, dict) or "op" not in entry:
+                raise ValueError(f"Step {index} needs an 'op'")
+            steps.append(PipelineStep(str(entry.get("id", index)), entry["op"], entry.get("input", SOURCE),
+                                      entry.get("params")))
+        return cls(steps)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_spec(json.load(f))
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(step_id):
+            if state.get(step_id) == "done":
+                return
+            if state.get(step_id) == "visiting":
+                raise ValueError(f"Pipeline has a cycle through '{step_id}'")
+            state[step_id] = "visiting"
+            step = self.steps[step_id]
+            if step.input != SOURCE:
+                visit(step.input)
+            state[step_id] = "done"
+            order.append(step_id)
+
+        for step_id in self.steps:
+            visit(step_id)
+        return order
+
+    @property
+    def outputs(self):
+        """Steps no other step consumes, in execution order"""
+        consumed = {step.input for step in self.steps.values()}
+        return [step_id for step_id in self.order if step_id not in consumed]
+
+    @property
+    def needs_mask(self):
+        return any(PIPELINE_OPERATIONS[step.op][1] for step in self.steps.values())
+
+class PipelineRun:
+    """One execution of a pipeline on one image.
+
+    Each step runs at most once, on whichever thread first asks for it; result bytes are handed to
+    the next step as-is, so nothing is re-encoded in between. Independent branches run in parallel
+    when their outputs are requested from different threads.
+    """
+
+    def __init__(self, pipeline, api_key, image, mask=None, params=None):
+        if pipeline.needs_mask and mask is None:
+            raise ValueError("This pipeline has an erase step and needs a mask")
+        self.pipeline = pipeline
+        self.api_key = api_key
+        self.image = image
+        self.mask = mask
+        # Applied to every step unless the step sets it itself (e.g. output_format)
+        self.params = params or {}
+        self.errors = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _node(self, step_id):
+        if step_id == SOURCE:
+            return self.image
+
+        with self._lock:
+            future = self._futures.get(step_id)
+            owner = future is None
+            if owner:
+                future = self._futures[step_id] = Future()
+        if not owner:
+            return future.result()
+
+        result = None
+        try:
+            result = self._run_step(self.pipeline.steps[step_id])
+        finally:
+            future.set_result(result)
+        return result
+
+    def _run_step(self, step):
+        source = self._node(step.input)
+        if source is None:
+            return None
+
+        fn, needs_mask = PIPELINE_OPERATIONS[step.op]
+        args = [self.api_key, source] + ([self.mask] if needs_mask else [])
+        with capture_errors() as errors:
+            try:
+                result = fn(*args, **{**self.params, **step.params})
+            except TypeError as e:
+                # Bad params in the spec, e.g. a missing background_prompt
+                report_error(f"Invalid parameters: {str(e)}")
+                result = None
+        if result is None:
+            self.errors[step.id] = errors or ["No result returned"]
+        return result
+
+    def failure(self, step_id):
+        """Why a step has no result, traced back to the step that actually failed"""
+        step = self.pipeline.steps[step_id]
+        # A step whose input failed never ran
+        while step.id not in self.errors and step.input != SOURCE:
+            step = self.pipeline.steps[step.input]
+        errors = self.errors.get(step.id, ["No result returned"])
+        return f"Step '{step.id}' ({step.op}) failed: {'; '.join(errors)}"
+
+    def output(self, step_id):
+        """Result of one step (running whatever it depends on), or None after reporting why"""
+        result = self._node(step_id)
+        if result is None:
+            report_error(self.failure(step_id))
+        return result
+
+    def run_all(self, step_ids=None, max_workers=MAX_PARALLEL_STEPS):
+        """Results for the given steps (default: the pipeline's outputs), branches in parallel"""
+        step_ids = step_ids or self.pipeline.outputs
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-step") as pool:
+            futures = {step_id: pool.submit(self._node, step_id) for step_id in step_ids}
+            return {step_id: future.result() for step_id, future in futures.items()}
+
+def show_pipeline_result(job):
+    result = job.result
+    st.image(result.display, caption=f"{job.caption} · {result.size[0]}x{result.size[1]}")
+    st.download_button(f"Download {result.extension.upper()}", result.data, f"{job.filename}.{result.extension}",
+                       result.mime, key=f"pipeline_download_{job.id}")
+
+def show_pipeline_interface(api_key):
+    """Chain edit steps on one image; outputs are launched together and shared steps run once"""
+    st.write("Chain background removal, background replacement, search & replace, erase and upscaling.")
+
+    uploaded_file = st.file_uploader("Choose an image:", type=['png', 'jpg', 'jpeg', 'webp'], key="pipeline_upload")
+    if uploaded_file is None:
+        return
+    try:
+        payload = get_session_payload(uploaded_file, "pipeline_payload")
+    except (ValueError, Image.DecompressionBombError) as e:
+        st.error(f"Could not load image: {str(e)}")
+        return
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        st.image(payload.display, caption=f"Input: {payload.size[0]}x{payload.size[1]}")
+
+    with col2:
+        preset = st.selectbox("Start from:", list(PIPELINE_PRESETS), key="pipeline_preset")
+        spec_text = st.text_area(
+            "Steps (JSON):",
+            json.dumps(PIPELINE_PRESETS[preset], indent=2),
+            height=300,
+            key=f"pipeline_spec_{preset}",
+            help=f"Each step: id, op ({', '.join(PIPELINE_OPERATIONS)}), input (a step id or '{SOURCE}'), params"
+        )
+        try:
+            pipeline = Pipeline.from_spec(json.loads(spec_text))
+        except ValueError as e:
+            st.error(f"Invalid pipeline: {str(e)}")
+            return
+
+        st.caption(" · ".join(f"{step_id}: {pipeline.steps[step_id].op} ← {pipeline.steps[step_id].input}"
+                              for step_id in pipeline.order))
+
+        mask = None
+        if pipeline.needs_mask:
+            mask_file = st.file_uploader("Mask for erase steps (white = erase):", type=['png', 'jpg', 'jpeg'],
+                                         key="pipeline_mask")
+            if mask_file is not None:
+                mask = Image.open(mask_file)
+
+        keep_intermediate = st.checkbox("Also keep intermediate results", key="pipeline_intermediate")
+
+        if st.button("🔗 Run pipeline", type="primary", use_container_width=True):
+            if pipeline.needs_mask and mask is None:
+                st.warning("Please upload a mask for the erase step")
+            else:
+                run = PipelineRun(pipeline, api_key, payload, mask, {"output_format": selected_output_format()})
+                stem = uploaded_file.name.split('.')[0]
+                # One job per shown step; steps they share run once, inside whichever job needs them first
+                for step_id in (pipeline.order if keep_intermediate else pipeline.outputs):
+                    submit_job("pipeline", f"{step_id} ({pipeline.steps[step_id].op})", f"{stem}_{step_id}",
+                               run.output, step_id)
+
+    show_jobs("pipeline", show_pipeline_result)
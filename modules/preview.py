@@ -0,0 +1,53 @@
+import numpy as np
+from PIL import Image
+
+# Local previews are computed at this size so they come back well under a second
+PREVIEW_MAX_SIZE = 512
+INPAINT_RADIUS = 5
+GRABCUT_ITERATIONS = 3
+# GrabCut assumes the subject sits inside this margin of the frame
+GRABCUT_MARGIN = 0.05
+
+def _small_rgb(image, max_size):
+    small = image.copy()
+    small.thumbnail((max_size, max_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return np.asarray(small.convert("RGB"))
+
+def preview_inpaint(image, mask, max_size=PREVIEW_MAX_SIZE, method="telea"):
+    """Low-res approximation of erase/inpaint: fill the masked area with cv2.inpaint"""
+    import cv2
+    rgb = _small_rgb(image, max_size)
+    height, width = rgb.shape[:2]
+
+    small_mask = np.asarray(mask.convert("L").resize((width, height), Image.Resampling.NEAREST))
+    small_mask = (small_mask > 127).astype(np.uint8) * 255
+
+    flag = cv2.INPAINT_TELEA if method == "telea" else cv2.INPAINT_NS
+    filled = cv2.inpaint(rgb, small_mask, INPAINT_RADIUS, flag)
+    return Image.fromarray(filled)
+
+def preview_remove_background(image, max_size=PREVIEW_MAX_SIZE, iterations=GRABCUT_ITERATIONS):
+    """Low-res approximation of background removal using GrabCut seeded with a centred rectangle"""
+    import cv2
+    rgb = _small_rgb(image, max_size)
+    height, width = rgb.shape[:2]
+
+    margin_x, margin_y = max(1, int(width * GRABCUT_MARGIN)), max(1, int(height * GRABCUT_MARGIN))
+    rect = (margin_x, margin_y, width - 2 * margin_x, height - 2 * margin_y)
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    background_model = np.zeros((1, 65), dtype=np.float64)
+    foreground_model = np.zeros((1, 65), dtype=np.float64)
+    cv2.grabCut(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), mask, rect, background_model, foreground_model,
+                iterations, cv2.GC_INIT_WITH_RECT)
+
+    alpha = np.where((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD), 255, 0).astype(np.uint8)
+    return Image.fromarray(np.dstack([rgb, alpha]), mode="RGBA")
+
+def local_preview(preview_fn, *args, **kwargs):
+    """Run a preview function, returning None instead of failing the real request"""
+    import cv2
+    try:
+        return preview_fn(*args, **kwargs)
+    except (cv2.error, ValueError):
+        return None
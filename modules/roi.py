@@ -0,0 +1,141 @@
+import math
+import numpy as np
+from PIL import Image
+from modules.utils import report_error, DEFAULT_OUTPUT_FORMAT
+from modules.payload import as_payload, ImageResult, local_encode_format
+from modules.mask import prepare_mask, finish_mask
+
+# Context kept around the mask's bounding box: a share of its longer side, but at least ROI_MIN_CONTEXT px
+ROI_CONTEXT = 0.5
+ROI_MIN_CONTEXT = 96
+# Crops are resampled to about this many pixels, the resolution the edit models work at natively
+ROI_TARGET_PIXELS = 1024 * 1024
+# Small crops are enlarged at most this much (the result is scaled back down anyway)
+ROI_MAX_UPSCALE = 2.0
+# Aspect ratio range the edit endpoints accept
+ROI_MAX_ASPECT = 2.5
+# Width of the blend between the edited crop and the untouched original (full-resolution px)
+ROI_SEAM_FEATHER = 48
+# Only the mask, grown and softened by this much (full-resolution px), is taken from the edited crop
+ROI_MASK_GROW = 12
+ROI_MASK_FEATHER = 6
+# ROI mode is on by default only when the padded region covers at most this share of the image
+ROI_MAX_COVERAGE = 0.5
+
+def roi_box(bbox, image_size, context=ROI_CONTEXT, min_context=ROI_MIN_CONTEXT, max_aspect=ROI_MAX_ASPECT):
+    """Pad a mask bounding box with context and fix its aspect ratio, clamped to the image"""
+    width, height = image_size
+    left, top, right, bottom = bbox
+    pad = max(min_context, int(context * max(right - left, bottom - top)))
+    left, top, right, bottom = left - pad, top - pad, right + pad, bottom + pad
+
+    # Widen the short side until the endpoint's aspect limit is met
+    box_width, box_height = right - left, bottom - top
+    if box_width > box_height * max_aspect:
+        grow = math.ceil(box_width / max_aspect) - box_height
+        top, bottom = top - grow // 2, bottom + grow - grow // 2
+    elif box_height > box_width * max_aspect:
+        grow = math.ceil(box_height / max_aspect) - box_width
+        left, right = left - grow // 2, right + grow - grow // 2
+
+    # Shift back inside the image before clamping, so context isn't lost on one side only
+    if left < 0:
+        right, left = right - left, 0
+    if top < 0:
+        bottom, top = bottom - top, 0
+    if right > width:
+        left, right = left - (right - width), width
+    if bottom > height:
+        top, bottom = top - (bottom - height), height
+    return max(0, left), max(0, top), min(width, right), min(height, bottom)
+
+def crop_size(box, target_pixels=ROI_TARGET_PIXELS, max_upscale=ROI_MAX_UPSCALE):
+    """Size the crop is sent at"""
+    width, height = box[2] - box[0], box[3] - box[1]
+    scale = min(max_upscale, math.sqrt(target_pixels / (width * height)))
+    return max(64, round(width * scale)), max(64, round(height * scale))
+
+def plan_roi(image_size, mask):
+    """(box, send size) for a mask, or None if the mask is empty"""
+    bbox = mask.getbbox()
+    if bbox is None:
+        return None
+    box = roi_box(bbox, image_size)
+    return box, crop_size(box)
+
+def roi_worthwhile(image_size, mask):
+    """True when the padded mask region is a small part of the frame; otherwise the whole image is better sent"""
+    plan = plan_roi(image_size, mask)
+    if plan is None:
+        return False
+    left, top, right, bottom = plan[0]
+    return (right - left) * (bottom - top) <= ROI_MAX_COVERAGE * image_size[0] * image_size[1]
+
+def _seam_weights(box, image_size, feather):
+    """1 inside the crop, ramping to 0 towards crop edges that lie inside the image"""
+    width, height = box[2] - box[0], box[3] - box[1]
+
+    def ramp(length, at_start, at_end):
+        weights = np.ones(length, dtype=np.float32)
+        size = min(feather, length // 4)
+        if size > 0:
+            edge = np.linspace(0, 1, size + 2, dtype=np.float32)[1:-1]
+            if at_start:
+                weights[:size] = edge
+            if at_end:
+                weights[-size:] = np.minimum(weights[-size:], edge[::-1])
+        return weights
+
+    ramp_x = ramp(width, box[0] > 0, box[2] < image_size[0])
+    ramp_y = ramp(height, box[1] > 0, box[3] < image_size[1])
+    return np.minimum.outer(ramp_y, ramp_x)[..., None]
+
+def _mask_weights(mask, box, grow=ROI_MASK_GROW, feather=ROI_MASK_FEATHER):
+    """Edit mask over the box, grown and softened so the edit's own edges blend in"""
+    region = np.asarray(mask.convert("L").crop(box))
+    softened = finish_mask(np.ascontiguousarray(region), dilate=grow, feather=feather)
+    return (np.asarray(softened, dtype=np.float32) / 255)[..., None]
+
+def paste_region(original, edited, box, mask, feather=ROI_SEAM_FEATHER):
+    """Blend an edited crop back into the full-resolution original through the edit mask.
+
+    Only the (softened) masked area comes from the resampled crop; the context around it keeps
+    the original's full-resolution pixels, with a seam ramp wherever the crop edge cuts the image.
+    """
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGB")
+    size = (box[2] - box[0], box[3] - box[1])
+    edited = edited.convert(original.mode)
+    if edited.size != size:
+        edited = edited.resize(size, Image.Resampling.LANCZOS)
+
+    weights = np.minimum(_seam_weights(box, original.size, feather), _mask_weights(mask, box))
+    region = np.asarray(original.crop(box), dtype=np.float32)
+    blended = region * (1 - weights) + np.asarray(edited, dtype=np.float32) * weights
+
+    result = original.copy()
+    result.paste(Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8), mode=original.mode), box[:2])
+    return result
+
+def edit_region(edit_fn, api_key, image, mask, *args, output_format=DEFAULT_OUTPUT_FORMAT, **kwargs):
+    """Run a masked edit (inpaint/erase) on the padded mask region only and paste it back at full resolution"""
+    original = as_payload(image).image
+    mask = prepare_mask(original, mask)
+    plan = plan_roi(original.size, mask)
+    if plan is None:
+        report_error("The mask is empty")
+        return None
+    box, send_size = plan
+
+    crop = original.crop(box).resize(send_size, Image.Resampling.LANCZOS)
+    # Nearest keeps a hard mask binary; a feathered one stays soft
+    resample = Image.Resampling.NEAREST if mask.mode == "1" else Image.Resampling.BILINEAR
+    crop_mask = mask.convert("L").crop(box).resize(send_size, resample)
+
+    result = edit_fn(api_key, crop, crop_mask, *args, output_format=output_format, **kwargs)
+    if result is None:
+        return None
+
+    # Decodes the crop result, pastes it into the full-resolution original and encodes the merged image
+    merged = paste_region(original, result.image, box, mask)
+    return ImageResult.from_image(merged, local_encode_format(output_format, merged))
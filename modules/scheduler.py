@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+
+# Account rate limit: STABILITY_RATE_LIMIT requests per STABILITY_RATE_WINDOW seconds.
+# Stability allows 150 per 10s; the default stays a little under it.
+RATE_LIMIT = float(os.environ.get("STABILITY_RATE_LIMIT", "140"))
+RATE_WINDOW = float(os.environ.get("STABILITY_RATE_WINDOW", "10"))
+BURST = int(os.environ.get("STABILITY_RATE_BURST", "10"))
+
+MAX_RETRIES = int(os.environ.get("STABILITY_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller in the process"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller, e.g. when the server answers 429 with Retry-After"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+class RetryScheduler:
+    """Paces requests through a token bucket and retries 429/5xx and connection failures"""
+
+    def __init__(self, bucket, max_retries=MAX_RETRIES):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _count_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def call(self, send):
+        """Run send() (which returns a requests.Response) under the rate limit, retrying transient failures"""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            last_attempt = attempt == self.max_retries
+
+            try:
+                response = send()
+            except requests.ConnectionError:
+                # Covers connect timeouts too; read timeouts are not retried since the server may
+                # still be working (and billing) on the request
+                if last_attempt:
+                    raise
+                self._count_retry()
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if response.status_code == 429:
+                self.bucket.pause(delay)
+
+            response.close()
+            self._count_retry()
+            time.sleep(delay)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler"""
+    global _scheduler
+
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                bucket = TokenBucket(RATE_LIMIT / RATE_WINDOW, BURST)
+                _scheduler = RetryScheduler(bucket)
+    return _scheduler
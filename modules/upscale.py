@@ -1,42 +1,154 @@
 import streamlit as st
-import requests
-import io
+from modules.utils import api_url, request_image_bytes, report_error, StabilityAPIError, DEFAULT_OUTPUT_FORMAT, selected_output_format
+from modules.payload import as_payload, ImageResult, local_encode_format
+from modules.ingest import ENDPOINT_MAX_PIXELS, fit_payload, get_session_payload
+import random
+import numpy as np
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from modules.utils import capture_errors
+from modules.jobs import submit_job, show_jobs
 
-def upscale_image(api_key, image, prompt=""):
+# Tiled mode: tile edge (input px), overlap between neighbours and tiles in flight at once
+TILE_SIZE = 1024
+TILE_OVERLAP = 128
+MAX_PARALLEL_TILES = 6
+# Largest upload the page accepts in tiled mode (output is roughly 16x this)
+TILED_MAX_PIXELS = 25_000_000
+
+def upscale_image(api_key, image, prompt="", seed=None, output_format=DEFAULT_OUTPUT_FORMAT):
     """Upscale image using Stability AI Conservative Upscaler"""
     
-    url = "https://api.stability.ai/v2beta/stable-image/upscale/conservative"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "image/*"
-    }
+    url = api_url("upscale/conservative")
     
-    # Convert PIL image to bytes
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    image_field = fit_payload(as_payload(image), ENDPOINT_MAX_PIXELS["upscale/conservative"]).file_field()
     
     files = {
-        "image": ("image.png", img_byte_arr, "image/png"),
+        "image": image_field,
         "prompt": (None, prompt if prompt else "enhance image quality and resolution"),
-        "output_format": (None, "png")
+        "output_format": (None, output_format)
     }
     
+    if seed is not None:
+        files["seed"] = (None, str(seed))
+    
     try:
-        response = requests.post(url, headers=headers, files=files)
-        
-        if response.status_code == 200:
-            return Image.open(io.BytesIO(response.content))
-        else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
-            
+        return ImageResult(request_image_bytes(api_key, url, files, cacheable=seed is not None), url)
+    except StabilityAPIError as e:
+        report_error(f"Error: {e.status_code} - {e.text}")
+        return None
     except Exception as e:
-        st.error(f"Request failed: {str(e)}")
+        report_error(f"Request failed: {str(e)}")
         return None
 
+def tile_positions(length, tile_size, overlap):
+    """Start offsets along one axis; the last tile is pulled back to end flush with the edge"""
+    if length <= tile_size:
+        return [0]
+    step = tile_size - overlap
+    positions = list(range(0, length - tile_size, step))
+    positions.append(length - tile_size)
+    return positions
+
+def _edge_ramp(length, overlap):
+    """Weights rising 0 -> 1 across the leading overlap, 1 elsewhere"""
+    ramp = np.ones(length, dtype=np.float32)
+    if overlap > 0:
+        ramp[:overlap] = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+    return ramp
+
+def upscale_tiled(api_key, image, prompt="", tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                  max_workers=MAX_PARALLEL_TILES, seed=None, output_format=DEFAULT_OUTPUT_FORMAT):
+    """Upscale an image of any size as overlapping tiles in parallel, feather-blending the seams"""
+    image = as_payload(image).image
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    width, height = image.size
+    
+    xs = tile_positions(width, tile_size, overlap)
+    ys = tile_positions(height, tile_size, overlap)
+    if len(xs) == 1 and len(ys) == 1:
+        return upscale_image(api_key, image, prompt, seed, output_format)
+    
+    # One seed for every tile keeps texture consistent across seams
+    if seed is None:
+        seed = random.randint(1, 4294967294)
+    
+    boxes = [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for y in ys for x in xs]
+    
+    def run(box):
+        with capture_errors() as errors:
+            return upscale_image(api_key, image.crop(box), prompt, seed, output_format), errors
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(run, boxes))
+    
+    failed = [errors for tile, errors in results if tile is None]
+    if failed:
+        report_error(f"{len(failed)} of {len(boxes)} tiles failed: {'; '.join(failed[0]) or 'no result'}")
+        return None
+    
+    first_box, (first_tile, _) = boxes[0], results[0]
+    scale = first_tile.size[0] / (first_box[2] - first_box[0])
+    out_width, out_height = round(width * scale), round(height * scale)
+    channels = len(image.getbands())
+    canvas = np.zeros((out_height, out_width, channels), dtype=np.uint8)
+    
+    # Paste in raster order, blending each tile over what its left/top neighbours already wrote
+    for index, (box, (tile, _)) in enumerate(zip(boxes, results)):
+        column, row = index % len(xs), index // len(xs)
+        left, top = round(box[0] * scale), round(box[1] * scale)
+        right, bottom = round(box[2] * scale), round(box[3] * scale)
+        
+        tile = tile.image.convert(image.mode)
+        if tile.size != (right - left, bottom - top):
+            tile = tile.resize((right - left, bottom - top), Image.Resampling.LANCZOS)
+        pixels = np.asarray(tile, dtype=np.float32)
+        
+        overlap_x = round((xs[column - 1] + tile_size - box[0]) * scale) if column > 0 else 0
+        overlap_y = round((ys[row - 1] + tile_size - box[1]) * scale) if row > 0 else 0
+        weight = np.outer(_edge_ramp(bottom - top, overlap_y), _edge_ramp(right - left, overlap_x))[..., None]
+        
+        region = canvas[top:bottom, left:right].astype(np.float32)
+        canvas[top:bottom, left:right] = np.clip(region * (1 - weight) + pixels * weight + 0.5, 0, 255).astype(np.uint8)
+    
+    # The stitched image is new, so this is the one unavoidable encode
+    stitched = Image.fromarray(canvas, mode=image.mode)
+    return ImageResult.from_image(stitched, local_encode_format(output_format, stitched))
+
+def show_upscaled_result(job):
+    """Upscaled image with before/after stats"""
+    upscaled_image = job.result
+    original_width, original_height = job.details["original_size"]
+    
+    st.subheader("✨ Enhanced Image")
+    st.image(upscaled_image.display, caption=f"Size: {upscaled_image.size[0]}x{upscaled_image.size[1]} pixels")
+    
+    # Calculate improvements
+    original_pixels = original_width * original_height
+    upscaled_pixels = upscaled_image.size[0] * upscaled_image.size[1]
+    pixel_improvement = upscaled_pixels / original_pixels
+    
+    # Show stats
+    st.success(f"🎉 Resolution enhanced by {pixel_improvement:.1f}x!")
+    
+    col_stats1, col_stats2 = st.columns(2)
+    with col_stats1:
+        st.metric("Width", f"{upscaled_image.size[0]}px", f"+{upscaled_image.size[0] - original_width}")
+    with col_stats2:
+        st.metric("Height", f"{upscaled_image.size[1]}px", f"+{upscaled_image.size[1] - original_height}")
+    
+    # Download
+    st.markdown("---")
+    st.download_button(
+        label="📥 Download Enhanced Image",
+        data=upscaled_image.data,
+        file_name=f"{job.filename}.{upscaled_image.extension}",
+        mime=upscaled_image.mime,
+        use_container_width=True,
+        key=f"upscale_download_{job.id}"
+    )
+
 def show_upscale_interface(api_key):
     """Show the upscale interface"""
     
@@ -50,14 +162,19 @@ def show_upscale_interface(api_key):
     )
     
     if uploaded_file is not None:
-        # Display original image
-        original_image = Image.open(uploaded_file)
+        # Display original image; kept at full size here so tiled mode can use every pixel
+        try:
+            payload = get_session_payload(uploaded_file, "upscale_payload", TILED_MAX_PIXELS)
+        except (ValueError, Image.DecompressionBombError) as e:
+            st.error(f"Could not load image: {str(e)}")
+            return
+        width, height = payload.size
         
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("📷 Original Image")
-            st.image(original_image, caption=f"Size: {original_image.size[0]}x{original_image.size[1]} pixels")
+            st.image(payload.display, caption=f"Size: {width}x{height} pixels")
             
             # Show file info
             file_size = len(uploaded_file.getvalue()) / 1024  # KB
@@ -71,39 +188,27 @@ def show_upscale_interface(api_key):
             help="Describe what aspects to enhance"
         )
         
+        too_large = width * height > TILE_SIZE * TILE_SIZE
+        tiled = st.checkbox(
+            "Tiled mode (large images)",
+            value=too_large,
+            help="Upscale overlapping tiles in parallel and blend them back together"
+        )
+        if too_large and not tiled:
+            st.caption("Without tiled mode the image is downscaled to the upscaler's input limit first.")
+        
         # Upscale button
         if st.button("📈 Upscale Image", type="primary", use_container_width=True):
-            with st.spinner("🚀 Enhancing image resolution..."):
-                upscaled_image = upscale_image(api_key, original_image, prompt)
-                
-                if upscaled_image:
-                    with col2:
-                        st.subheader("✨ Enhanced Image")
-                        st.image(upscaled_image, caption=f"Size: {upscaled_image.size[0]}x{upscaled_image.size[1]} pixels")
-                        
-                        # Calculate improvements
-                        original_pixels = original_image.size[0] * original_image.size[1]
-                        upscaled_pixels = upscaled_image.size[0] * upscaled_image.size[1]
-                        pixel_improvement = upscaled_pixels / original_pixels
-                        
-                        # Show stats
-                        st.success(f"🎉 Resolution enhanced by {pixel_improvement:.1f}x!")
-                        
-                        col_stats1, col_stats2 = st.columns(2)
-                        with col_stats1:
-                            st.metric("Width", f"{upscaled_image.size[0]}px", f"+{upscaled_image.size[0] - original_image.size[0]}")
-                        with col_stats2:
-                            st.metric("Height", f"{upscaled_image.size[1]}px", f"+{upscaled_image.size[1] - original_image.size[1]}")
-                        
-                        # Download
-                        st.markdown("---")
-                        buf = io.BytesIO()
-                        upscaled_image.save(buf, format="PNG")
-                        
-                        st.download_button(
-                            label="📥 Download Enhanced Image",
-                            data=buf.getvalue(),
-                            file_name=f"upscaled_{uploaded_file.name.split('.')[0]}.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
+            fn = upscale_tiled if tiled else upscale_image
+            submit_job(
+                "upscale",
+                "Enhancing image resolution" + (" (tiled)" if tiled else ""),
+                f"upscaled_{uploaded_file.name.split('.')[0]}",
+                fn,
+                api_key, payload, prompt,
+                output_format=selected_output_format(),
+                details={"original_size": (width, height)}
+            )
+        
+        with col2:
+            show_jobs("upscale", show_upscaled_result)
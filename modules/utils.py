@@ -1 +1,227 @@
+import io
+import os
+import time
+import threading
+from contextlib import contextmanager
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3 import encode_multipart_formdata
+from modules.cache import get_cache, request_fingerprint, SingleFlight
+from modules.scheduler import get_scheduler
+from modules.metrics import registry, endpoint_name, take_encode_time, write_metrics_file
 
+# Shared HTTP client settings (override with environment variables)
+POOL_SIZE = int(os.environ.get("STABILITY_POOL_SIZE", "16"))
+CONNECT_TIMEOUT = float(os.environ.get("STABILITY_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("STABILITY_READ_TIMEOUT", "120"))
+# Point at a stand-in server (e.g. bench/stub_server.py) instead of the real API
+API_HOST = os.environ.get("STABILITY_API_HOST", "https://api.stability.ai").rstrip("/")
+# Set STABILITY_SINGLE_FLIGHT=0 to send every request upstream, even identical concurrent ones
+SINGLE_FLIGHT = os.environ.get("STABILITY_SINGLE_FLIGHT", "1") != "0"
+
+# Response formats offered in the UI; PNG only where alpha or lossless output matters
+OUTPUT_FORMATS = {
+    "WebP": "webp",
+    "JPEG": "jpeg",
+    "PNG": "png"
+}
+DEFAULT_OUTPUT_FORMAT = os.environ.get("STABILITY_OUTPUT_FORMAT", "webp")
+
+_session = None
+_session_lock = threading.Lock()
+_error_sink = threading.local()
+# Identical cacheable requests in flight at the same time (from any session) share one upstream call
+_in_flight = SingleFlight()
+
+def configure_client(pool_size=None, connect_timeout=None, read_timeout=None, api_host=None):
+    """Change pool size / timeouts / API host; the pooled session is rebuilt on next use"""
+    global POOL_SIZE, CONNECT_TIMEOUT, READ_TIMEOUT, API_HOST, _session
+
+    with _session_lock:
+        if api_host is not None:
+            API_HOST = api_host.rstrip("/")
+        if pool_size is not None:
+            POOL_SIZE = int(pool_size)
+        if connect_timeout is not None:
+            CONNECT_TIMEOUT = float(connect_timeout)
+        if read_timeout is not None:
+            READ_TIMEOUT = float(read_timeout)
+
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def api_url(path):
+    """Full URL of a v2beta stable-image endpoint, e.g. api_url("edit/erase")"""
+    return f"{API_HOST}/v2beta/stable-image/{path}"
+
+def get_session():
+    """Return the process-wide pooled session shared by all Streamlit threads"""
+    global _session
+
+    session = _session
+    if session is not None:
+        return session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # pool_block keeps us at POOL_SIZE sockets instead of opening throwaway ones
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Connection"] = "keep-alive"
+            _session = session
+        return _session
+
+class _TimedBody(io.BytesIO):
+    """Request body that notes when its last byte was handed to the socket"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.finished = None
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        if not chunk and self.finished is None:
+            self.finished = time.perf_counter()
+        return chunk
+
+def _form_fields(files):
+    """requests-style files dict -> urllib3 multipart fields"""
+    fields = {}
+    for name, (filename, value, *rest) in files.items():
+        if filename is None:
+            fields[name] = str(value)
+        else:
+            fields[name] = (filename, value, rest[0] if rest else "application/octet-stream")
+    return fields
+
+def stability_post(api_key, url, files, timeout=None, stream=False):
+    """POST multipart form data to a Stability endpoint over a warm pooled connection"""
+    body, content_type = encode_multipart_formdata(_form_fields(files))
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "image/*",
+        "Content-Type": content_type
+    }
+
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    upload = _TimedBody(body)
+    started = time.perf_counter()
+    response = get_session().post(url, headers=headers, data=upload, timeout=timeout, stream=stream)
+    headers_received = time.perf_counter()
+
+    # Phase timings for metrics: sending the body vs. waiting for the server to answer
+    upload_finished = upload.finished or headers_received
+    response.upload_seconds = upload_finished - started
+    response.wait_seconds = headers_received - upload_finished
+    response.bytes_out = len(body)
+    return response
+
+def read_body(response):
+    """Read a streamed body into one buffer straight off the socket, then hand the connection back"""
+    try:
+        return response.raw.read(decode_content=True)
+    finally:
+        response.raw.release_conn()
+
+class StabilityAPIError(Exception):
+    """Non-200 response from a Stability endpoint"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+def request_image_bytes(api_key, url, files, cacheable=False):
+    """Return the raw response bytes, answering repeatable requests from the result cache"""
+    endpoint = endpoint_name(url)
+    encode_seconds = take_encode_time()
+    if encode_seconds:
+        registry.observe(endpoint, "encode", encode_seconds)
+
+    if not cacheable:
+        # Unseeded requests are expected to differ, so they are never cached or shared
+        return _fetch_image_bytes(api_key, url, files, endpoint, encode_seconds)
+
+    cache = get_cache()
+    key = request_fingerprint(url, files)
+    data = cache.get(key)
+    if data is not None:
+        registry.record_cache_hit(endpoint)
+        return data
+
+    def fetch():
+        data = _fetch_image_bytes(api_key, url, files, endpoint, encode_seconds)
+        # Stored before the call is released, so later arrivals hit the cache instead
+        cache.put(key, data)
+        return data
+
+    if not SINGLE_FLIGHT:
+        return fetch()
+    data, shared = _in_flight.do(key, fetch)
+    if shared:
+        registry.record_coalesced(endpoint)
+    return data
+
+def _fetch_image_bytes(api_key, url, files, endpoint, encode_seconds):
+    attempts = 0
+
+    def send():
+        nonlocal attempts
+        attempts += 1
+        return stability_post(api_key, url, files, stream=True)
+
+    started = time.perf_counter()
+    try:
+        # Paced by the shared token bucket; 429/5xx are retried with backoff before we give up
+        response = get_scheduler().call(send)
+    except requests.RequestException:
+        registry.record_call(endpoint, "error", retries=max(0, attempts - 1))
+        write_metrics_file()
+        raise
+
+    registry.observe(endpoint, "upload", response.upload_seconds)
+    registry.observe(endpoint, "wait", response.wait_seconds)
+
+    if response.status_code != 200:
+        registry.record_call(endpoint, response.status_code, response.bytes_out, retries=attempts - 1)
+        write_metrics_file()
+        raise StabilityAPIError(response.status_code, response.text)
+
+    download_started = time.perf_counter()
+    data = read_body(response)
+    finished = time.perf_counter()
+
+    registry.observe(endpoint, "download", finished - download_started)
+    registry.observe(endpoint, "total", encode_seconds + finished - started)
+    registry.record_call(endpoint, 200, response.bytes_out, len(data), attempts - 1)
+    write_metrics_file()
+    return data
+
+def report_error(message):
+    """Show an API error on the page, or collect it when running in a background job"""
+    errors = getattr(_error_sink, "errors", None)
+    if errors is not None:
+        errors.append(message)
+    else:
+        st.error(message)
+
+@contextmanager
+def capture_errors():
+    """Collect report_error messages from this thread instead of writing them to the page"""
+    previous = getattr(_error_sink, "errors", None)
+    errors = []
+    _error_sink.errors = errors
+    try:
+        yield errors
+    finally:
+        _error_sink.errors = previous
+
+def selected_output_format():
+    """Output format picked in the sidebar for this session"""
+    return st.session_state.get("output_format", DEFAULT_OUTPUT_FORMAT)
@@ -0,0 +1,111 @@
+"""Background warm-up so the first request on a fresh process costs about the same as later ones.
+
+Usage (import-time breakdown of the app's dependencies in a fresh interpreter):
+    python -m modules.warmup
+"""
+import os
+import sys
+import time
+import importlib
+import threading
+import subprocess
+
+# Set STABILITY_WARMUP=0 to skip the background warm-up
+WARMUP_ENABLED = os.environ.get("STABILITY_WARMUP", "1") != "0"
+# Pre-imported here off the request path. cv2 is the slowest import in the app, so modules/mask.py
+# and modules/preview.py import it inside the functions that use it rather than at module level
+WARM_IMPORTS = ("cv2", "numpy", "PIL.Image", "PIL.ImageOps", "PIL.ImageDraw")
+# Dependencies measured by the import-time report
+REPORTED_IMPORTS = ("streamlit", "requests", "numpy", "PIL.Image", "cv2")
+PRECONNECT_TIMEOUT = 5.0
+
+_report = {}
+_report_lock = threading.Lock()
+_thread = None
+_thread_lock = threading.Lock()
+
+def _record(step, seconds, note=""):
+    with _report_lock:
+        _report[step] = {"seconds": seconds, "note": note}
+
+def _timed(step, fn):
+    started = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        # Warm-up is best effort; the real request will surface any actual problem
+        _record(step, time.perf_counter() - started, f"failed: {e}")
+    else:
+        _record(step, time.perf_counter() - started)
+
+def _preconnect():
+    """Open a pooled TLS connection to the API host so the first call skips DNS + handshake"""
+    from modules.utils import get_session, API_HOST
+    # Any status will do; the (non-streamed) response is released back to the pool, connection kept open
+    get_session().head(API_HOST, timeout=PRECONNECT_TIMEOUT)
+
+def _init_pil():
+    from PIL import Image
+    # Registers every format plugin now instead of on the first open of a non-core format
+    Image.init()
+
+def warm_up():
+    """Pre-import heavy modules, initialise PIL plugins and pre-connect to the API"""
+    for name in WARM_IMPORTS:
+        note = "already imported" if name in sys.modules else ""
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            note = f"failed: {e}"
+        _record(f"import {name}", time.perf_counter() - started, note)
+    _timed("PIL plugins", _init_pil)
+    _timed("API pre-connect", _preconnect)
+
+def start_warmup():
+    """Run warm_up() on a background thread (once per process)"""
+    global _thread
+
+    if not WARMUP_ENABLED:
+        return None
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+def warmup_report():
+    """Rows describing what the warm-up did and how long each step took"""
+    with _report_lock:
+        return [{"step": step, "ms": round(1000 * entry["seconds"], 1), "note": entry["note"]}
+                for step, entry in _report.items()]
+
+def measure_imports(modules=REPORTED_IMPORTS, top=15):
+    """Cumulative import times (seconds) in a fresh interpreter, from python -X importtime"""
+    code = "; ".join(f"import {name}" for name in modules)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+
+    timings = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        timings.append((name.strip(), int(cumulative_us) / 1e6, int(self_us) / 1e6))
+
+    requested = [entry for entry in timings if entry[0] in modules]
+    slowest = sorted(timings, key=lambda entry: entry[1], reverse=True)[:top]
+    return requested, slowest
+
+def main():
+    requested, slowest = measure_imports()
+    print("Requested imports (cumulative, fresh interpreter):")
+    for name, cumulative, _ in requested:
+        print(f"  {name:30} {cumulative * 1000:8.1f} ms")
+    print("Slowest modules overall:")
+    for name, cumulative, own in slowest:
+        print(f"  {name:30} {cumulative * 1000:8.1f} ms cumulative, {own * 1000:6.1f} ms self")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import numpy as np
+from PIL import Image, ImageDraw
+from modules.mask import prepare_mask, finish_mask, is_prepared_mask
+
+SIZE = (200, 150)
+CIRCLE = (80, 55, 120, 95)
+
+def grayscale_photo():
+    """Mode "L" gradient with plenty of mid-gray and bright pixels, like a real photo"""
+    x = np.linspace(0, 255, SIZE[0], dtype=np.float32)
+    y = np.linspace(0, 255, SIZE[1], dtype=np.float32)
+    return Image.fromarray(((x[None, :] + y[:, None]) / 2).astype(np.uint8), mode="L")
+
+def painted(original):
+    image = original.copy()
+    ImageDraw.Draw(image).ellipse(CIRCLE, fill=255)
+    return image
+
+def circle_share():
+    mask = Image.new("L", SIZE, 0)
+    ImageDraw.Draw(mask).ellipse(CIRCLE, fill=255)
+    return np.count_nonzero(np.asarray(mask)) / (SIZE[0] * SIZE[1])
+
+def mask_share(mask):
+    return np.count_nonzero(np.asarray(mask.convert("L")) > 127) / (SIZE[0] * SIZE[1])
+
+def test_painted_grayscale_upload_is_not_passed_through():
+    original = grayscale_photo()
+    upload = painted(original)
+    assert not is_prepared_mask(upload)
+
+    mask = prepare_mask(original, upload)
+    # Only the circle, not the bright half of the photo
+    assert abs(mask_share(mask) - circle_share()) < 0.01
+
+def test_painted_grayscale_upload_with_dilate_is_extracted():
+    original = grayscale_photo()
+    mask = prepare_mask(original, painted(original), dilate=1)
+    assert circle_share() <= mask_share(mask) < 2 * circle_share()
+
+def test_black_and_white_masks_pass_through():
+    mask = Image.new("L", SIZE, 0)
+    ImageDraw.Draw(mask).ellipse(CIRCLE, fill=255)
+    assert prepare_mask(grayscale_photo(), mask) is mask
+    one_bit = mask.convert("1")
+    assert prepare_mask(grayscale_photo(), one_bit) is one_bit
+
+def test_feathered_masks_pass_through():
+    hard = np.zeros((SIZE[1], SIZE[0]), dtype=np.uint8)
+    hard[50:100, 70:130] = 255
+    soft = finish_mask(hard, feather=4)
+    assert soft.mode == "L" and is_prepared_mask(soft)
+    assert prepare_mask(grayscale_photo(), soft) is soft